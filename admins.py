@@ -0,0 +1,86 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from telethon import utils, types
+from telethon.tl.types import ChannelParticipantsAdmins
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", 600))   # seconds
+MAX_CHATS = 5000
+
+# Raw updates that can change who is an admin of a chat
+PARTICIPANT_UPDATES = (
+    types.UpdateChannelParticipant,
+    types.UpdateChatParticipant,
+    types.UpdateChatParticipantAdmin,
+    types.UpdateChatParticipants
+)
+
+class AdminCache:
+    """
+    Per-chat admin id sets with a TTL. Concurrent lookups for a chat that is
+    not cached share one get_participants request; a failed request is not
+    cached. invalidate() drops a chat (and discards a lookup still in flight)
+    so the next check refetches.
+    """
+
+    def __init__(self, client, ttl=ADMIN_CACHE_TTL, maxsize=MAX_CHATS):
+        self.client = client
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._admins = OrderedDict()   # chat_id -> (expires_at, frozenset of user ids)
+        self._inflight = {}            # chat_id -> future of a running lookup
+        self._generation = {}          # chat_id -> bumped on invalidate
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, chat_id):
+        entry = self._admins.get(chat_id)
+        if entry and entry[0] > time.monotonic():
+            self._admins.move_to_end(chat_id)
+            self.hits += 1
+            return entry[1]
+        future = self._inflight.get(chat_id)
+        if future is None:
+            self.misses += 1
+            future = self._inflight[chat_id] = asyncio.ensure_future(self._fetch(chat_id))
+            future.add_done_callback(lambda f: self._inflight.pop(chat_id, None) if self._inflight.get(chat_id) is f else None)
+        return await asyncio.shield(future)
+
+    async def is_admin(self, chat_id, user_id):
+        return user_id in await self.get(chat_id)
+
+    async def _fetch(self, chat_id):
+        generation = self._generation.get(chat_id, 0)
+        admins = await self.client.get_participants(chat_id, filter=ChannelParticipantsAdmins)
+        ids = frozenset(admin.id for admin in admins)
+        if self._generation.get(chat_id, 0) == generation:
+            self._admins[chat_id] = (time.monotonic() + self.ttl, ids)
+            self._admins.move_to_end(chat_id)
+            while len(self._admins) > self.maxsize:
+                self._admins.popitem(last=False)
+        return ids
+
+    def invalidate(self, chat_id):
+        self._admins.pop(chat_id, None)
+        self._inflight.pop(chat_id, None)
+        self._generation[chat_id] = self._generation.get(chat_id, 0) + 1
+        if len(self._generation) > 2 * self.maxsize:
+            self._generation = {cid: gen for cid, gen in self._generation.items() if cid in self._admins}
+
+    def on_update(self, update):
+        """Invalidates the chat a raw participant/admin update refers to."""
+        if isinstance(update, types.UpdateChannelParticipant):
+            self.invalidate(utils.get_peer_id(types.PeerChannel(update.channel_id)))
+        elif isinstance(update, (types.UpdateChatParticipant, types.UpdateChatParticipantAdmin)):
+            self.invalidate(utils.get_peer_id(types.PeerChat(update.chat_id)))
+        elif isinstance(update, types.UpdateChatParticipants):
+            self.invalidate(utils.get_peer_id(types.PeerChat(update.participants.chat_id)))
+
+    def __len__(self):
+        return len(self._admins)
@@ -0,0 +1,294 @@
+"""
+Offline scraper benchmark.
+
+Serves recorded fixtures (bench/fixtures) and synthetically inflated pages
+from a local HTTP stand-in, then times scraper.get_latest_jobs and
+scraper.get_job_details against it. Reports throughput, p50/p99 latency and
+peak Python memory per scenario (this process only; parse pool workers are
+not traced), and checks the extracted output:
+fixtures against bench/fixtures/expected.json, inflated pages across code
+paths (streaming vs full listing parse, parse pool vs inline).
+
+    python bench/bench_scraper.py                   # full run
+    python bench/bench_scraper.py --quick           # a few iterations, for CI
+    python bench/bench_scraper.py --parse-workers 4 # details parsed on the pool
+    python bench/bench_scraper.py --update-golden   # re-record expected.json
+    python bench/bench_scraper.py --record          # refresh fixtures from the live site
+
+Exits with status 1 if any output check fails.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import tracemalloc
+import http.server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scraper
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+LISTING_FIXTURE = "latest-jobs.html"
+DETAIL_FIXTURE = "job-detail.html"
+GOLDEN = os.path.join(FIXTURES, "expected.json")
+ALL_JOBS = 100000   # a listing limit no page reaches
+
+# --- SYNTHETIC PAGES ---
+
+def inflate_listing(links=5000, seed=1):
+    """A listing page with `links` anchors (about a third of them job links) spread over nested lists."""
+    rng = random.Random(seed)
+    kinds = ["Apply Online Form", "Online Form", "Admit Card", "Result", "Answer Key", "Syllabus"]
+    parts = ["<!DOCTYPE html><html><head><title>Inflated Listing</title>",
+             "<script>var cfg = {a: '<a href=\"x\">Apply</a>'};</script></head><body><main>"]
+    for block in range(0, links, 50):
+        parts.append(f'<div class="post-column"><h2>Section {block // 50}</h2><ul>')
+        for i in range(block, min(block + 50, links)):
+            kind = rng.choice(kinds)
+            href = f"https://example.invalid/post-{i}/" if rng.random() > 0.05 else f"/relative-{i}/"
+            parts.append(f'<li><a href="{href}"><b>Post {i}</b> {kind}</a> <span>new</span></li>')
+        parts.append("</ul></div>")
+    parts.append("</main></body></html>")
+    return "".join(parts)
+
+def inflate_detail(tables=300, rows=20, seed=2):
+    """A job page with `tables` tables of `rows` rows, keyword headers scattered between them."""
+    rng = random.Random(seed)
+    headers = ["Important Dates", "Application Fee", "Age Limit", "Vacancy Details", "Eligibility", "Selection Process"]
+    parts = ["<!DOCTYPE html><html><head><title>Inflated Job</title></head><body>",
+             "<h1>Inflated Recruitment 2024 Apply Online Form</h1>"]
+    for t in range(tables):
+        parts.append(f"<h3>{rng.choice(headers)} Part {t}</h3>")
+        parts.append('<table border="1">')
+        for r in range(rows):
+            parts.append(f"<tr><td>Row {t}.{r}</td><td>{rng.randint(1, 9999)}</td><td>Detail text {rng.random():.6f}</td></tr>")
+        parts.append("</table>")
+        if t % 10 == 0:
+            parts.append(f"<ul><li>Note {t} A</li><li>Note {t} B</li></ul>")
+    parts.append('<h2>Some Useful Important Links</h2><table border="1">')
+    for label, link in [("Apply Online", "Registration"), ("Apply Online", "Login"),
+                        ("Download Notification", "Click Here"), ("Official Website", "Click Here")]:
+        parts.append(f'<tr><td>{label}</td><td><a href="https://example.invalid/{label}/{link}">{link}</a></td></tr>')
+    parts.append("</table></body></html>")
+    return "".join(parts)
+
+# --- LOCAL HTTP STAND-IN ---
+
+class StandIn:
+    """Serves fixed pages by path on localhost, optionally after a fixed delay."""
+
+    def __init__(self, pages, latency=0.0):
+        self.pages = {path: body.encode("utf-8") for path, body in pages.items()}
+        self.latency = latency
+        pages, latency = self.pages, self.latency
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # otherwise keep-alive responses stall ~40 ms on delayed ACKs
+
+            def do_GET(self):
+                body = pages.get(self.path)
+                if latency: time.sleep(latency)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass    # the streaming listing parser hangs up early
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+# --- MEASUREMENT ---
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def measure(name, call, iterations, cached=False):
+    """Times `iterations` calls (page cache cleared before each unless `cached`), then one traced call for peak memory."""
+    scraper._cache.clear()
+    result = call()     # warm-up: connection pool, first-parse setup
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if not cached: scraper._cache.clear()
+        t0 = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    if not cached: scraper._cache.clear()
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {
+        "scenario": name,
+        "iterations": iterations,
+        "throughput": iterations / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "peak_kib": peak / 1024
+    }
+
+def print_table(rows):
+    print(f"\n{'scenario':<34} {'iter':>5} {'calls/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>10}")
+    for r in rows:
+        print(f"{r['scenario']:<34} {r['iterations']:>5} {r['throughput']:>9.1f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['peak_kib']:>10.0f}")
+
+# --- OUTPUT CHECKS ---
+
+def golden_outputs(listing_html, detail_html):
+    """What the current extraction code produces for the recorded fixtures."""
+    return {
+        "listing": scraper.parse_latest_jobs(listing_html, limit=scraper.LISTING_LIMIT),
+        "listing_all": scraper.parse_latest_jobs(listing_html, limit=ALL_JOBS),
+        "detail": scraper.parse_job_details(detail_html)
+    }
+
+def check(failures, label, got, expected):
+    if got != expected:
+        failures.append(label)
+        print(f"❌ Output mismatch: {label}")
+
+def record_fixtures():
+    """Downloads the live listing page and its first job page into bench/fixtures."""
+    session = scraper.get_session()
+    listing = session.get(scraper.LISTING_URL, timeout=scraper.REQUEST_TIMEOUT)
+    listing.raise_for_status()
+    jobs = scraper.parse_latest_jobs(listing.text, limit=1)
+    if not jobs:
+        sys.exit("No job links on the live listing page, fixtures left unchanged.")
+    detail = session.get(jobs[0]["url"], timeout=scraper.REQUEST_TIMEOUT)
+    detail.raise_for_status()
+    for name, text in ((LISTING_FIXTURE, listing.text), (DETAIL_FIXTURE, detail.text)):
+        with open(os.path.join(FIXTURES, name), "w", encoding="utf-8") as f:
+            f.write(text)
+    print(f"Recorded {scraper.LISTING_URL} and {jobs[0]['url']}. Run --update-golden next.")
+
+# --- MAIN ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scraper benchmark")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--quick", action="store_true", help="3 iterations and smaller synthetic pages")
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in response delay in ms")
+    parser.add_argument("--parse-workers", type=int, default=0, help="start the scraper parse pool with N workers")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    parser.add_argument("--update-golden", action="store_true", help="re-record expected.json from the current code")
+    parser.add_argument("--record", action="store_true", help="download fresh fixtures from the live site")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures()
+        return 0
+
+    # Every request goes to the local stand-in; a politeness delay would only time sleeps.
+    scraper.HOST_DELAY = 0
+
+    with open(os.path.join(FIXTURES, LISTING_FIXTURE), encoding="utf-8") as f:
+        listing_html = f.read()
+    with open(os.path.join(FIXTURES, DETAIL_FIXTURE), encoding="utf-8") as f:
+        detail_html = f.read()
+
+    if args.update_golden:
+        with open(GOLDEN, "w", encoding="utf-8") as f:
+            json.dump(golden_outputs(listing_html, detail_html), f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Wrote {GOLDEN}")
+        return 0
+
+    iterations = 3 if args.quick else args.iterations
+    big_listing = inflate_listing(500 if args.quick else 5000)
+    big_detail = inflate_detail(30 if args.quick else 300)
+    pages = {
+        "/latest-jobs/": listing_html,
+        "/job-detail/": detail_html,
+        "/inflated-listing/": big_listing,
+        "/inflated-detail/": big_detail
+    }
+
+    if args.parse_workers:
+        scraper.start_parse_pool(args.parse_workers)
+
+    failures = []
+    rows = []
+    with open(GOLDEN, encoding="utf-8") as f:
+        golden = json.load(f)
+
+    with StandIn(pages, latency=args.latency / 1000) as site:
+        def listing(path, limit, stream):
+            def call():
+                scraper.LISTING_URL = site.base + path
+                return scraper.get_latest_jobs(limit=limit, stream=stream)
+            return call
+
+        def detail(path):
+            return lambda: scraper.get_job_details(site.base + path)
+
+        scenarios = [
+            ("listing fixture / stream", listing("/latest-jobs/", scraper.LISTING_LIMIT, True), "listing"),
+            ("listing fixture / full parse", listing("/latest-jobs/", scraper.LISTING_LIMIT, False), "listing"),
+            ("listing fixture / all jobs", listing("/latest-jobs/", ALL_JOBS, True), "listing_all"),
+            ("listing fixture / cached", listing("/latest-jobs/", scraper.LISTING_LIMIT, True), "listing"),
+            ("detail fixture", detail("/job-detail/"), "detail"),
+        ]
+        for name, call, key in scenarios:
+            result, row = measure(name, call, iterations, cached=name.endswith("cached"))
+            rows.append(row)
+            check(failures, f"{name} vs expected.json", json.loads(json.dumps(result)), golden[key])
+
+        # Inflated pages have no recorded output; the code paths must agree with each other.
+        full = listing("/inflated-listing/", ALL_JOBS, False)
+        result_full, row = measure("inflated listing / full parse", full, iterations)
+        rows.append(row)
+        streamed = listing("/inflated-listing/", ALL_JOBS, True)
+        result_stream, row = measure("inflated listing / stream", streamed, iterations)
+        rows.append(row)
+        check(failures, "inflated listing: stream vs full parse", result_stream, result_full)
+        check(failures, "inflated listing vs direct parse", result_full, scraper.parse_latest_jobs(big_listing, limit=ALL_JOBS))
+
+        result_detail, row = measure("inflated detail", detail("/inflated-detail/"), iterations)
+        rows.append(row)
+        check(failures, "inflated detail vs inline parse", result_detail, scraper.parse_job_details(big_detail))
+
+    scraper.stop_parse_pool()
+    print_table(rows)
+    print(f"\nparser={scraper.PARSER} parse_workers={args.parse_workers} "
+          f"inflated listing={len(big_listing) // 1024} KiB, detail={len(big_detail) // 1024} KiB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"parser": scraper.PARSER, "parse_workers": args.parse_workers, "results": rows, "failures": failures}, f, indent=2)
+
+    if failures:
+        print(f"\n❌ {len(failures)} output check(s) failed")
+        return 1
+    print("\n✅ All outputs match")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
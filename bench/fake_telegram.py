@@ -0,0 +1,149 @@
+"""
+In-process stand-in for Telethon's TelegramClient, for load tests.
+
+Sends cost a simulated latency and can fail the way Telegram does:
+FloodWaitError at a configurable rate, ChatWriteForbiddenError for chats in
+`forbidden`, UserIsBlockedError for users in `blocked`. Handlers registered
+with .on() are kept, and emit_source_post() feeds a NewMessage event to them
+as if a post appeared in the source channel. Nothing touches the network.
+"""
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon import errors, events, types
+
+class Profile:
+    """How the fake Telegram behaves. Shared by every FakeTelegramClient."""
+
+    def __init__(self, latency_ms=40.0, jitter_ms=20.0, flood_rate=0.0, flood_seconds=1,
+                 forbidden=(), blocked=(), seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.forbidden = set(int(c) for c in forbidden)
+        self.blocked = set(int(u) for u in blocked)
+        self.rng = random.Random(seed)
+
+class FakeTelegramClient:
+    profile = Profile()
+    instances = []
+
+    def __init__(self, session=None, api_id=None, api_hash=None, **kwargs):
+        self.handlers = []          # [(event builder, callback)]
+        self.sent = []              # [(monotonic time, chat_id, text)] of successful sends
+        self.errors = {}            # error name -> count
+        self.calls = 0
+        self._next_id = 1
+        self._connected = False
+        FakeTelegramClient.instances.append(self)
+
+    # --- lifecycle ---
+    async def start(self, *args, **kwargs):
+        self._connected = True
+        return self
+
+    async def connect(self):
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self):
+        return self._connected
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_me(self):
+        return types.User(id=1000, is_self=True, bot=True, username="harness_bot", first_name="Harness")
+
+    async def __call__(self, request, *args, **kwargs):
+        return None
+
+    def on(self, builder):
+        def decorator(callback):
+            self.handlers.append((builder, callback))
+            return callback
+        return decorator
+
+    def add_event_handler(self, callback, builder=None):
+        self.handlers.append((builder, callback))
+
+    # --- sending ---
+    async def _deliver(self, chat_id, text):
+        self.calls += 1
+        profile = self.profile
+        await asyncio.sleep(max(0.0, profile.rng.gauss(profile.latency, profile.jitter)))
+        chat_id = int(chat_id)
+        error = None
+        if chat_id in profile.forbidden:
+            error = errors.ChatWriteForbiddenError(request=None)
+        elif chat_id in profile.blocked:
+            error = errors.UserIsBlockedError(request=None)
+        elif profile.flood_rate and profile.rng.random() < profile.flood_rate:
+            error = errors.FloodWaitError(request=None, capture=profile.flood_seconds)
+        if error is not None:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise error
+        self.sent.append((time.monotonic(), chat_id, text))
+        self._next_id += 1
+        return types.Message(id=self._next_id, peer_id=types.PeerUser(chat_id),
+                             date=datetime.now(timezone.utc), message=text)
+
+    async def send_message(self, entity, message="", **kwargs):
+        text = message.message if isinstance(message, types.Message) else str(message)
+        return await self._deliver(entity, text)
+
+    async def send_file(self, entity, file, caption="", **kwargs):
+        return await self._deliver(entity, caption)
+
+    async def edit_message(self, entity, message, text=None, **kwargs):
+        return None
+
+    async def get_messages(self, entity, ids=None, **kwargs):
+        return None
+
+    async def get_participants(self, entity, filter=None, **kwargs):
+        return []
+
+    async def get_entity(self, entity):
+        return types.User(id=int(entity), first_name="User")
+
+    async def iter_messages(self, *args, **kwargs):
+        return
+        yield
+
+    # --- source channel ---
+    async def emit_source_post(self, msg_id, text):
+        """Dispatches a channel post to the NewMessage handlers, like Telethon would."""
+        msg = types.Message(id=msg_id, peer_id=types.PeerChannel(1), date=datetime.now(timezone.utc), message=text)
+        event = SimpleNamespace(message=msg)
+        for builder, callback in self.handlers:
+            if isinstance(builder, events.NewMessage):
+                await callback(event)
+        return msg
+
+class FakeEvent:
+    """Just enough of a NewMessage event for the admin command handlers."""
+
+    def __init__(self, client, sender_id, text, reply_message=None, chat_id=None):
+        self.client = client
+        self.sender_id = sender_id
+        self.chat_id = chat_id or sender_id
+        self.text = text
+        self.is_private = self.chat_id > 0
+        self._reply = reply_message
+        self.reply_to_msg_id = reply_message.id if reply_message is not None else None
+        self.responses = []
+
+    async def get_reply_message(self):
+        return self._reply
+
+    async def respond(self, text, **kwargs):
+        self.responses.append(text)
+        return SimpleNamespace(chat_id=self.chat_id, id=len(self.responses))
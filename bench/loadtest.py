@@ -0,0 +1,205 @@
+"""
+Load test for the scheduler and broadcast paths of main.py.
+
+main.create_app() is given two bench/fake_telegram.py clients, the database
+lives in a throwaway directory, and nothing reaches Telegram. The run has two phases:
+
+1. Scheduler: N groups are registered, the source channel emits posts, and
+   global_scheduler forwards them (plus the daily promo and, with --ads, the
+   ad loop) through the dispatcher.
+2. Broadcast: /broadcastp to M users through broadcast_handler.
+
+Reported: messages/sec, end-to-end alert latency (source post -> group),
+scheduler pass time, and RSS growth per phase.
+
+    python bench/loadtest.py --quick
+    python bench/loadtest.py --groups 10000 --users 200000 --send-rate 2000
+    python bench/loadtest.py --flood-rate 0.001 --forbidden 0.02 --blocked 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import fake_telegram
+
+ADMIN_ID = 42
+
+def rss_mib():
+    """Current resident set size (falls back to the peak where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(samples, pct):
+    if not samples: return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+def load_main(profile):
+    """Builds main.py's app around fake Telegram clients, in a scratch working directory."""
+    fake_telegram.FakeTelegramClient.profile = profile
+    os.environ.setdefault("BOT_TOKEN", "1000:loadtest")
+    os.environ["ADMIN_IDS"] = str(ADMIN_ID)
+    os.chdir(tempfile.mkdtemp(prefix="loadtest-"))
+    import main
+    logging.getLogger().setLevel(logging.ERROR)
+    main.create_app(user=fake_telegram.FakeTelegramClient(), bot=fake_telegram.FakeTelegramClient())
+    main.load_state()
+    return main
+
+async def wait_until(condition, timeout, poll=0.05):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(poll)
+    return True
+
+async def run(args):
+    group_ids = [-1000000000 - i for i in range(args.groups)]
+    user_ids = [5000000 + i for i in range(args.users)]
+    forbidden = group_ids[:int(args.groups * args.forbidden)]
+    blocked = user_ids[:int(args.users * args.blocked)]
+    profile = fake_telegram.Profile(args.latency, args.jitter, args.flood_rate, args.flood_seconds,
+                                    forbidden, blocked, seed=args.seed)
+
+    rss = {"start": rss_mib()}
+    main = load_main(profile)
+    import ratelimit
+    ratelimit.global_bucket.rate = args.send_rate
+    ratelimit.global_bucket.capacity = max(1.0, args.send_rate)
+    if args.group_pacing is not None:
+        ratelimit.chat_limiter.group_interval = args.group_pacing
+    bot, source = main.bot_client, main.user_client
+
+    # --- seed ---
+    t0 = time.perf_counter()
+    with main.store.lock:
+        for gid in group_ids:
+            main.db["groups"][str(gid)] = {"interval": args.interval, "last_post": 0, "active": True}
+        for uid in user_ids:
+            main.db["users"].add(uid)
+        if args.ads:
+            main.db["ads"].update(active=True, content="<b>Load test ad</b>", interval=args.interval, limit=args.posts, sent=0, last_sent=0)
+        main.save_db(main.db)
+        for gid in group_ids:
+            main.group_schedule.update(str(gid))
+    seed_time = time.perf_counter() - t0
+    rss["seeded"] = rss_mib()
+    print(f"Seeded {args.groups} groups and {args.users} users in {seed_time:.2f}s")
+
+    # --- phase 1: scheduler ---
+    reachable = args.groups - len(forbidden)
+    posted_at = {}
+    sent_before = len(bot.sent)
+    scheduler = asyncio.create_task(main.global_scheduler())
+    started = time.monotonic()
+    for k in range(1, args.posts + 1):
+        text = f"Load test alert #{k}"
+        posted_at[text] = time.monotonic()
+        await source.emit_source_post(10000 + k, text)
+        if k < args.posts:
+            await asyncio.sleep(args.post_interval)
+
+    def delivered():
+        return sum(1 for _, _, text in bot.sent[sent_before:] if text in posted_at)
+
+    finished = await wait_until(lambda: delivered() >= reachable * args.posts and main.dispatcher.depth == 0, args.timeout)
+    elapsed = time.monotonic() - started
+    scheduler.cancel()
+    sends = bot.sent[sent_before:]
+    latencies = [t - posted_at[text] for t, _, text in sends if text in posted_at]
+    passes = main.SCHEDULER_PASS_SECONDS.stats()
+    rss["scheduler"] = rss_mib()
+    scheduler_report = {
+        "complete": finished,
+        "alerts": f"{len(latencies)}/{reachable * args.posts}",
+        "sends": len(sends),
+        "msgs_per_sec": len(sends) / elapsed if elapsed else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p99_s": percentile(latencies, 99),
+        "latency_max_s": max(latencies) if latencies else float("nan"),
+        "passes": passes["count"],
+        "pass_mean_ms": passes["sum"] / passes["count"] * 1000 if passes["count"] else 0.0,
+        "pass_p99_ms_le": passes["p99"] * 1000 if passes["p99"] is not None else None,
+        "groups_deactivated": sum(1 for s in main.db["groups"].values() if not s.get("active", True))
+    }
+
+    # --- phase 2: broadcast ---
+    sent_before = len(bot.sent)
+    reply = await bot.send_message(ADMIN_ID, "Load test broadcast")
+    sent_before += 1
+    event = fake_telegram.FakeEvent(bot, ADMIN_ID, "/broadcastp", reply_message=reply)
+    started = time.monotonic()
+    await asyncio.wait_for(main.broadcast_handler(event), args.timeout)
+    elapsed = time.monotonic() - started
+    rss["broadcast"] = rss_mib()
+    job = main.broadcast_store.recent(1)[0]
+    counts = main.broadcast_store.counts(job["id"])
+    broadcast_report = {
+        "state": job["state"],
+        "targets": job["total"],
+        "sent": counts["sent"] + counts["flood_retried"],
+        "blocked": counts["blocked"],
+        "failed": counts["failed"],
+        "seconds": elapsed,
+        "msgs_per_sec": (len(bot.sent) - sent_before) / elapsed if elapsed else 0.0
+    }
+
+    main.flush_ledger()
+    main.store.close()
+    return scheduler_report, broadcast_report, rss, dict(bot.errors)
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduler/broadcast load test against a fake Telegram")
+    parser.add_argument("--groups", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--posts", type=int, default=3, help="source posts to emit")
+    parser.add_argument("--post-interval", type=float, default=2.0, help="seconds between source posts")
+    parser.add_argument("--interval", type=float, default=0.05, help="group forwarding interval in minutes")
+    parser.add_argument("--ads", action="store_true", help="also run the ad loop")
+    parser.add_argument("--send-rate", type=float, default=5000, help="global token bucket rate (Telegram allows ~30/s)")
+    parser.add_argument("--group-pacing", type=float, default=None,
+                        help="seconds between sends to one group (default: ratelimit.GROUP_CHAT_INTERVAL)")
+    parser.add_argument("--latency", type=float, default=40.0, help="mean send latency in ms")
+    parser.add_argument("--jitter", type=float, default=20.0, help="send latency std deviation in ms")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="fraction of sends answered with FloodWaitError")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--forbidden", type=float, default=0.01, help="fraction of groups the bot can no longer write to")
+    parser.add_argument("--blocked", type=float, default=0.02, help="fraction of users that blocked the bot")
+    parser.add_argument("--timeout", type=float, default=600.0, help="per-phase limit in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="200 groups, 5000 users, 1 post")
+    args = parser.parse_args()
+    if args.quick:
+        args.groups, args.users, args.posts = 200, 5000, 1
+
+    scheduler_report, broadcast_report, rss, errors = asyncio.run(run(args))
+
+    print("\n--- Scheduler ---")
+    for key, value in scheduler_report.items():
+        print(f"{key:<20} {value:.3f}" if isinstance(value, float) else f"{key:<20} {value}")
+    print("\n--- Broadcast ---")
+    for key, value in broadcast_report.items():
+        print(f"{key:<20} {value:.3f}" if isinstance(value, float) else f"{key:<20} {value}")
+    print("\n--- Memory (RSS MiB) ---")
+    previous = None
+    for phase, value in rss.items():
+        growth = f"  (+{value - previous:.1f})" if previous is not None else ""
+        print(f"{phase:<20} {value:.1f}{growth}")
+        previous = value
+    print(f"\nSimulated errors: {errors or 'none'}")
+    return 0 if scheduler_report["complete"] and broadcast_report["state"] == "done" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import Counter
+
+from telethon import errors
+
+import ratelimit
+import fanout
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+WORKERS = int(os.environ.get("BROADCAST_WORKERS", 20))
+MAX_FLOOD_RETRIES = 3
+PROGRESS_INTERVAL = 5   # seconds between status message edits
+BROADCAST_DB = os.environ.get("BROADCAST_DB", "broadcasts.sqlite3")
+CHECKPOINT_EVERY = int(os.environ.get("BROADCAST_CHECKPOINT_EVERY", 50))
+
+# Per-target outcomes
+SENT = "sent"
+FLOOD_RETRIED = "flood_retried"   # sent, but only after waiting out a FloodWaitError
+BLOCKED = "blocked"               # private user blocked the bot or deleted the account
+KICKED = "kicked"                 # bot removed from the group or can no longer write there
+FAILED = "failed"
+
+BLOCKED_ERRORS = (
+    errors.UserIsBlockedError,
+    errors.InputUserDeactivatedError,
+    errors.UserDeactivatedError,
+    errors.UserDeactivatedBanError
+)
+KICKED_ERRORS = (
+    errors.ChatWriteForbiddenError,
+    errors.ChannelPrivateError,
+    errors.UserBannedInChannelError,
+    errors.UserKickedError,
+    errors.ChatAdminRequiredError,
+    errors.ChatRestrictedError,
+    errors.ChannelInvalidError,
+    errors.ChatIdInvalidError,
+    errors.PeerIdInvalidError
+)
+
+SEND_SECONDS = metrics.histogram("telegram_send_seconds", "Latency of one send API call")
+SENDS = metrics.counter("sends_total", "Finished sends by outcome", ["outcome"])
+
+async def send_with_retry(client, chat_id, message, bucket=None, limiter=None, **kwargs):
+    """
+    Sends one message within the shared rate limits, waiting out FloodWaitError
+    (which also pauses every other sender on the bucket). Returns an outcome.
+    `message` may be a fanout.Payload, which sends from its cached reference.
+    """
+    outcome = await _send_with_retry(client, chat_id, message, bucket, limiter, **kwargs)
+    SENDS.inc(outcome=outcome)
+    return outcome
+
+async def _send_with_retry(client, chat_id, message, bucket, limiter, **kwargs):
+    bucket = bucket or ratelimit.global_bucket
+    limiter = limiter or ratelimit.chat_limiter
+    flooded = False
+    for _ in range(MAX_FLOOD_RETRIES + 1):
+        # Chat slot first, global token last: a token taken before a per-chat
+        # wait would be spent in a burst once the waiters wake up together.
+        await limiter.wait(chat_id)
+        try:
+            outcome = await send_once(client, chat_id, message, bucket, **kwargs)
+            return FLOOD_RETRIED if flooded and outcome == SENT else outcome
+        except errors.FloodWaitError as e:
+            flooded = True
+            logger.warning(f"FloodWait {e.seconds}s while sending to {chat_id}")
+            bucket.pause(e.seconds)
+            await asyncio.sleep(e.seconds)
+    return FAILED
+
+async def send_once(client, chat_id, message, bucket=None, **kwargs):
+    """
+    One send attempt, for callers that do their own per-chat spacing (the
+    dispatcher): takes a global token, then sends. FloodWaitError is raised
+    to the caller; other errors become an outcome. Not counted in SENDS.
+    """
+    await (bucket or ratelimit.global_bucket).acquire()
+    try:
+        with SEND_SECONDS.time():
+            if isinstance(message, fanout.Payload):
+                await message.send(client, int(chat_id), **kwargs)
+            else:
+                await client.send_message(int(chat_id), message, **kwargs)
+        return SENT
+    except errors.FloodWaitError:
+        raise
+    except BLOCKED_ERRORS:
+        return BLOCKED
+    except KICKED_ERRORS:
+        return KICKED
+    except Exception as e:
+        logger.warning(f"Send to {chat_id} failed: {e}")
+        return FAILED
+
+class BroadcastStore:
+    """
+    On-disk record of broadcast jobs so a restart can resume them instead of
+    starting over. A job keeps the source message reference, the status
+    message to edit, its full target list with a per-target outcome (NULL
+    until sent) and a cursor counting finished targets.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at REAL NOT NULL,
+        source_chat INTEGER NOT NULL,
+        source_msg INTEGER NOT NULL,
+        status_chat INTEGER,
+        status_msg INTEGER,
+        total INTEGER NOT NULL,
+        cursor INTEGER NOT NULL DEFAULT 0,
+        state TEXT NOT NULL DEFAULT 'running'
+    );
+    CREATE TABLE IF NOT EXISTS targets (
+        job_id INTEGER NOT NULL,
+        target TEXT NOT NULL,
+        outcome TEXT,
+        PRIMARY KEY (job_id, target)
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state);
+    """
+
+    def __init__(self, path=BROADCAST_DB):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def create(self, targets, source_chat, source_msg, status_chat=None, status_msg=None):
+        targets = list(dict.fromkeys(str(t) for t in targets))
+        with self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (created_at, source_chat, source_msg, status_chat, status_msg, total) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), source_chat, source_msg, status_chat, status_msg, len(targets))
+            )
+            job_id = cur.lastrowid
+            self._conn.executemany("INSERT INTO targets (job_id, target) VALUES (?, ?)", [(job_id, t) for t in targets])
+        return job_id
+
+    def get(self, job_id):
+        return self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def running(self):
+        return self._conn.execute("SELECT * FROM jobs WHERE state = 'running' ORDER BY id").fetchall()
+
+    def recent(self, limit=10):
+        return self._conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+    def pending_targets(self, job_id):
+        return [row[0] for row in self._conn.execute(
+            "SELECT target FROM targets WHERE job_id = ? AND outcome IS NULL", (job_id,))]
+
+    def counts(self, job_id):
+        return Counter({row[0]: row[1] for row in self._conn.execute(
+            "SELECT outcome, COUNT(*) FROM targets WHERE job_id = ? AND outcome IS NOT NULL GROUP BY outcome", (job_id,))})
+
+    def checkpoint(self, job_id, results):
+        """Persists a batch of (target, outcome) and advances the cursor."""
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE targets SET outcome = ? WHERE job_id = ? AND target = ?",
+                [(outcome, job_id, str(target)) for target, outcome in results]
+            )
+            self._conn.execute("UPDATE jobs SET cursor = cursor + ? WHERE id = ?", (len(results), job_id))
+
+    def finish(self, job_id, state):
+        with self._conn:
+            self._conn.execute("UPDATE jobs SET state = ? WHERE id = ?", (state, job_id))
+
+    def prune(self, older_than=7 * 86400):
+        """Drops per-target rows of jobs that ended long ago; the job summary row stays."""
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM targets WHERE job_id IN (SELECT id FROM jobs WHERE state != 'running' AND created_at < ?)",
+                (time.time() - older_than,)
+            )
+
+class Broadcast:
+    """
+    Sends one message to many chats with a pool of workers sharing the global
+    token bucket. Outcomes are kept per target; `counts` aggregates them.
+    With a store/job_id, outcomes are checkpointed every CHECKPOINT_EVERY
+    sends, and `targets` only needs the ones still pending.
+    """
+
+    def __init__(self, client, targets, message, workers=WORKERS, store=None, job_id=None, total=None):
+        self.client = client
+        self.targets = list(targets)
+        self.message = message
+        self.workers = workers
+        self.store = store
+        self.job_id = job_id
+        self.outcomes = {}
+        self.counts = store.counts(job_id) if store else Counter()
+        self.total = total if total is not None else len(self.targets)
+        self.cancelled = False
+        self.started_at = None
+        self._unsaved = []
+
+    @classmethod
+    def resume(cls, client, store, job, message):
+        """Rebuilds a persisted job; only targets without an outcome are sent to."""
+        return cls(client, store.pending_targets(job["id"]), message, store=store, job_id=job["id"], total=job["total"])
+
+    @property
+    def done(self):
+        return sum(self.counts.values())
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _record(self, target, outcome):
+        self.outcomes[target] = outcome
+        self.counts[outcome] += 1
+        if self.store:
+            self._unsaved.append((target, outcome))
+            if len(self._unsaved) >= CHECKPOINT_EVERY:
+                self._checkpoint()
+
+    def _checkpoint(self):
+        if self.store and self._unsaved:
+            batch, self._unsaved = self._unsaved, []
+            self.store.checkpoint(self.job_id, batch)
+
+    async def run(self, on_progress=None):
+        """Sends to every target. on_progress(self) is awaited every PROGRESS_INTERVAL seconds."""
+        self.started_at = time.time()
+        pending = iter(self.targets)
+
+        async def worker():
+            for target in pending:
+                if self.cancelled: break
+                outcome = await send_with_retry(self.client, target, self.message)
+                self._record(target, outcome)
+
+        async def report():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                try: await on_progress(self)
+                except Exception as e: logger.warning(f"Broadcast progress update failed: {e}")
+
+        reporter = asyncio.create_task(report()) if on_progress else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(self.targets)) or 1)))
+        finally:
+            if reporter: reporter.cancel()
+            self._checkpoint()
+        if self.store:
+            self.store.finish(self.job_id, "cancelled" if self.cancelled else "done")
+        return self
+
+    def summary(self):
+        delivered = self.counts[SENT] + self.counts[FLOOD_RETRIED]
+        return (
+            f"✅ Sent: {delivered}/{self.total}\n"
+            f"⏳ Flood-retried: {self.counts[FLOOD_RETRIED]}\n"
+            f"🚫 Blocked: {self.counts[BLOCKED]}\n"
+            f"👢 Kicked: {self.counts[KICKED]}\n"
+            f"❌ Failed: {self.counts[FAILED]}"
+        )
@@ -0,0 +1,532 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+DB_BACKEND = os.environ.get("DB_BACKEND", "sqlite").strip().lower()   # "sqlite" or "json"
+DB_FILE = "database.json"
+SQLITE_FILE = os.environ.get("SQLITE_FILE", "database.sqlite3")
+FLUSH_INTERVAL = float(os.environ.get("DB_FLUSH_INTERVAL", 3))         # json mode: seconds between writes
+
+# Default Ad Config
+DEFAULT_AD = {
+    "active": False,
+    "content": "Advertise here!",
+    "interval": 60,
+    "limit": 0,
+    "sent": 0,
+    "last_sent": 0
+}
+
+DEFAULT_GROUP = {"interval": 30, "last_post": 0, "active": True}
+
+class UserRegistry:
+    """
+    Private users who started the bot, keyed by id for O(1) membership.
+    Each user carries (joined_at, last_seen) plus a blocked flag so broadcasts
+    can skip dead chats. Changed ids are tracked so stores can write only
+    those rows.
+
+    Serialized as column arrays aligned with the sorted id list:
+    {"ids": [...], "joined_at": [...], "last_seen": [...], "blocked": [ids]}
+    """
+
+    def __init__(self):
+        self._users = {}        # id -> (joined_at, last_seen)
+        self.blocked = set()
+        self._dirty = set()
+
+    @classmethod
+    def from_json(cls, ids, meta=None):
+        """`ids` alone is the old plain-list format; `meta` holds the columns."""
+        registry = cls()
+        meta = meta or {}
+        joined = meta.get("joined_at") or [0] * len(ids)
+        seen = meta.get("last_seen") or joined
+        registry._users = dict(zip(ids, zip(joined, seen)))
+        registry.blocked = set(meta.get("blocked", ())) & registry._users.keys()
+        return registry
+
+    def to_json(self):
+        ids = sorted(self._users)
+        users = self._users
+        return {
+            "ids": ids,
+            "joined_at": [users[uid][0] for uid in ids],
+            "last_seen": [users[uid][1] for uid in ids],
+            "blocked": sorted(self.blocked)
+        }
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __len__(self):
+        return len(self._users)
+
+    def __iter__(self):
+        return iter(self._users)
+
+    def add(self, user_id, now=None):
+        """Registers a user, or refreshes last_seen (and unblocks) a known one. True if new."""
+        now = now or time.time()
+        self._dirty.add(user_id)
+        self.blocked.discard(user_id)
+        if user_id in self._users:
+            self._users[user_id] = (self._users[user_id][0], now)
+            return False
+        self._users[user_id] = (now, now)
+        return True
+
+    def remove(self, user_id):
+        if user_id in self._users:
+            del self._users[user_id]
+            self.blocked.discard(user_id)
+            self._dirty.add(user_id)
+
+    def mark_blocked(self, user_id):
+        if user_id in self._users and user_id not in self.blocked:
+            self.blocked.add(user_id)
+            self._dirty.add(user_id)
+
+    def get(self, user_id):
+        """(joined_at, last_seen, blocked) or None."""
+        if user_id not in self._users:
+            return None
+        joined_at, last_seen = self._users[user_id]
+        return joined_at, last_seen, user_id in self.blocked
+
+    def active(self):
+        """Ids of users that have not blocked the bot."""
+        if not self.blocked:
+            return list(self._users)
+        return [uid for uid in self._users if uid not in self.blocked]
+
+    def snapshot(self):
+        """Detached copy for serializing on another thread (two C-level copies)."""
+        copy = UserRegistry()
+        copy._users = dict(self._users)
+        copy.blocked = set(self.blocked)
+        return copy
+
+    def drain_dirty(self):
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+def _encode(value):
+    if isinstance(value, UserRegistry):
+        return value.to_json()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _snapshot(data):
+    """
+    Copy of the db that later mutations cannot reach: containers are copied
+    one level deep, which covers every in-place update the bot makes (group
+    values such as sent_ids are replaced, never mutated).
+    """
+    snapshot = dict(data)
+    snapshot["groups"] = {gid: dict(settings) for gid, settings in data["groups"].items()}
+    snapshot["users"] = data["users"].snapshot()
+    snapshot["ads"] = dict(data["ads"])
+    snapshot["settings"] = dict(data["settings"])
+    return snapshot
+
+def default_db():
+    return {"groups": {}, "users": UserRegistry(), "ads": dict(DEFAULT_AD), "settings": {"last_support_promo": 0}}
+
+def _normalize(data):
+    """Upgrades older database.json layouts in place."""
+    if isinstance(data.get("groups"), list):
+        new_groups = {}
+        for gid in data["groups"]:
+            new_groups[str(gid)] = dict(DEFAULT_GROUP)
+        data["groups"] = new_groups
+    users = data.get("users", [])
+    if isinstance(users, dict):
+        data["users"] = UserRegistry.from_json(users["ids"], users)
+    else:
+        data["users"] = UserRegistry.from_json(users)
+    if "ads" not in data: data["ads"] = dict(DEFAULT_AD)
+    if "settings" not in data: data["settings"] = {"last_support_promo": 0}
+    return data
+
+class JsonStore:
+    """
+    Single-file store with write-behind: save() only marks the data dirty and
+    a background thread writes database.json at most every `flush_interval`
+    seconds, coalescing any number of mutations into one snapshot. Writes go
+    through a temp file, fsync and an atomic rename, so a crash leaves either
+    the old or the new file, never a truncated one. The snapshot is taken
+    under `lock` (SyncedStore shares it with the bot's mutations), so it is
+    never torn. That is only a shallow copy; serializing and writing it
+    happen outside the lock, so the loop is not held up by a flush.
+    """
+
+    def __init__(self, path=DB_FILE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.lock = threading.RLock()
+        self.flush_interval = flush_interval
+        self._data = None
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+        self._write_lock = threading.Lock()
+        self._flusher = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return default_db()
+        with open(self.path, 'r') as f:
+            try:
+                return _normalize(json.load(f))
+            except Exception as e:
+                logger.error(f"Could not parse {self.path}, starting empty: {e}")
+                return default_db()
+
+    def save(self, data):
+        self._data = data
+        data["users"].drain_dirty()
+        self._dirty.set()
+        if self.flush_interval <= 0:
+            self.flush()
+        elif self._flusher is None:
+            self._flusher = threading.Thread(target=self._run, name="db-flusher", daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        while not self._closed.is_set():
+            if self._dirty.wait(timeout=1):
+                # Let more mutations pile up before paying for a full write.
+                self._closed.wait(self.flush_interval)
+                self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            if not self._dirty.is_set() or self._data is None:
+                return
+            self._dirty.clear()
+            try:
+                with self.lock:
+                    snapshot = _snapshot(self._data)
+                payload = json.dumps(snapshot, default=_encode)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error(f"Failed to write {self.path}, will retry: {e}")
+                self._dirty.set()
+
+    def stop_flusher(self):
+        """Stops the background writer. Call without holding `lock`: its last flush needs it."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+
+    def close(self):
+        """Stops the flusher and writes any pending changes."""
+        self.stop_flusher()
+        self.flush()
+
+    # Row-level calls have nothing finer to write in this mode.
+    def save_group(self, data, gid):
+        self.save(data)
+
+    def save_groups(self, data, gids):
+        self.save(data)
+
+    def delete_group(self, data, gid):
+        self.save(data)
+
+    def save_user(self, data, user_id):
+        self.save(data)
+
+    def save_section(self, data, name):
+        self.save(data)
+
+class SQLiteStore:
+    """
+    SQLite (WAL) store with one row per group/user and key/value rows for the
+    ads and settings sections. load() returns the same dict layout as
+    database.json; writes only touch rows that changed.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS groups (
+        id TEXT PRIMARY KEY,
+        interval INTEGER NOT NULL DEFAULT 30,
+        last_post REAL NOT NULL DEFAULT 0,
+        active INTEGER NOT NULL DEFAULT 1,
+        last_msg_id INTEGER NOT NULL DEFAULT 0,
+        sent_ids TEXT NOT NULL DEFAULT '[]'
+    );
+    CREATE INDEX IF NOT EXISTS idx_groups_active ON groups(active);
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        joined_at REAL NOT NULL DEFAULT 0,
+        last_seen REAL NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS ads (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, path=SQLITE_FILE, json_path=DB_FILE):
+        self.path = path
+        self.json_path = json_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._add_missing_columns("groups", {
+            "last_msg_id": "INTEGER NOT NULL DEFAULT 0",
+            "sent_ids": "TEXT NOT NULL DEFAULT '[]'"
+        })
+        self._add_missing_columns("users", {
+            "joined_at": "REAL NOT NULL DEFAULT 0",
+            "last_seen": "REAL NOT NULL DEFAULT 0",
+            "blocked": "INTEGER NOT NULL DEFAULT 0"
+        })
+        self._snapshot = None
+
+    def _add_missing_columns(self, table, columns):
+        """Upgrades tables created by older versions of this schema."""
+        existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        with self._conn:
+            for name, definition in columns.items():
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    # --- LOAD / MIGRATION ---
+
+    def load(self):
+        with self._lock:
+            if self._is_empty() and os.path.exists(self.json_path):
+                self._migrate_json()
+
+            data = default_db()
+            for gid, interval, last_post, active, last_msg_id, sent_ids in self._conn.execute(
+                    "SELECT id, interval, last_post, active, last_msg_id, sent_ids FROM groups"):
+                data["groups"][gid] = {
+                    "interval": interval,
+                    "last_post": last_post,
+                    "active": bool(active),
+                    "last_msg_id": last_msg_id,
+                    "sent_ids": json.loads(sent_ids)
+                }
+            rows = self._conn.execute("SELECT id, joined_at, last_seen, blocked FROM users ORDER BY id").fetchall()
+            ids, joined, seen, blocked = zip(*rows) if rows else ((), (), (), ())
+            data["users"] = UserRegistry.from_json(list(ids), {
+                "joined_at": list(joined),
+                "last_seen": list(seen),
+                "blocked": [uid for uid, flag in zip(ids, blocked) if flag]
+            })
+            for name in ("ads", "settings"):
+                for key, value in self._conn.execute(f"SELECT key, value FROM {name}"):
+                    data[name][key] = json.loads(value)
+            self._snapshot = self._take_snapshot(data)
+            return data
+
+    def _is_empty(self):
+        for table in ("groups", "users", "ads", "settings"):
+            if self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    def _migrate_json(self):
+        """One-time import of database.json; the file is kept as *.migrated."""
+        data = JsonStore(self.json_path).load()
+        with self._conn:
+            self._write_all(data)
+        os.replace(self.json_path, f"{self.json_path}.migrated")
+        logger.info(f"✅ Migrated {len(data['groups'])} groups and {len(data['users'])} users from {self.json_path}")
+
+    # --- WRITES ---
+
+    def _take_snapshot(self, data):
+        return {
+            "groups": {gid: dict(settings) for gid, settings in data["groups"].items()},
+            "ads": dict(data["ads"]),
+            "settings": dict(data["settings"])
+        }
+
+    def _upsert_group(self, gid, settings):
+        self._conn.execute(
+            "INSERT INTO groups (id, interval, last_post, active, last_msg_id, sent_ids) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET interval=excluded.interval, last_post=excluded.last_post, "
+            "active=excluded.active, last_msg_id=excluded.last_msg_id, sent_ids=excluded.sent_ids",
+            (gid, settings.get("interval", 30), settings.get("last_post", 0), int(settings.get("active", True)),
+             settings.get("last_msg_id", 0), json.dumps(settings.get("sent_ids", [])))
+        )
+
+    def _write_users(self, users, user_ids):
+        rows, gone = [], []
+        for uid in user_ids:
+            info = users.get(uid)
+            if info is None:
+                gone.append((uid,))
+            else:
+                rows.append((uid, info[0], info[1], int(info[2])))
+        self._conn.executemany(
+            "INSERT INTO users (id, joined_at, last_seen, blocked) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET joined_at=excluded.joined_at, "
+            "last_seen=excluded.last_seen, blocked=excluded.blocked",
+            rows
+        )
+        self._conn.executemany("DELETE FROM users WHERE id = ?", gone)
+
+    def _write_section(self, name, values):
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO {name} (key, value) VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in values.items()]
+        )
+
+    def _write_all(self, data):
+        for gid, settings in data["groups"].items():
+            self._upsert_group(gid, settings)
+        users = data["users"]
+        users.drain_dirty()
+        self._write_users(users, list(users))
+        self._write_section("ads", data["ads"])
+        self._write_section("settings", data["settings"])
+
+    def save(self, data):
+        """Writes the rows that differ from what was last loaded or saved."""
+        with self._lock:
+            if self._snapshot is None:
+                with self._conn:
+                    self._write_all(data)
+                self._snapshot = self._take_snapshot(data)
+                return
+
+            old = self._snapshot
+            groups = data["groups"]
+            changed = [gid for gid, settings in groups.items() if old["groups"].get(gid) != settings]
+            removed = [gid for gid in old["groups"] if gid not in groups]
+            with self._conn:
+                for gid in changed:
+                    self._upsert_group(gid, groups[gid])
+                    old["groups"][gid] = dict(groups[gid])
+                for gid in removed:
+                    self._conn.execute("DELETE FROM groups WHERE id = ?", (gid,))
+                    del old["groups"][gid]
+                self._write_users(data["users"], data["users"].drain_dirty())
+                for name in ("ads", "settings"):
+                    if data[name] != old[name]:
+                        self._write_section(name, data[name])
+                        old[name] = dict(data[name])
+
+    def save_group(self, data, gid):
+        with self._lock, self._conn:
+            settings = data["groups"][gid]
+            self._upsert_group(gid, settings)
+            if self._snapshot is not None:
+                self._snapshot["groups"][gid] = dict(settings)
+
+    def save_groups(self, data, gids):
+        """Writes several group rows in one transaction."""
+        with self._lock, self._conn:
+            for gid in gids:
+                settings = data["groups"].get(gid)
+                if settings is None: continue
+                self._upsert_group(gid, settings)
+                if self._snapshot is not None:
+                    self._snapshot["groups"][gid] = dict(settings)
+
+    def delete_group(self, data, gid):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM groups WHERE id = ?", (gid,))
+            if self._snapshot is not None:
+                self._snapshot["groups"].pop(gid, None)
+
+    def save_user(self, data, user_id):
+        """Writes every user changed since the last save (normally just `user_id`)."""
+        with self._lock, self._conn:
+            users = data["users"]
+            self._write_users(users, users.drain_dirty() | {user_id})
+
+    def save_section(self, data, name):
+        with self._lock, self._conn:
+            self._write_section(name, data[name])
+            if self._snapshot is not None:
+                self._snapshot[name] = dict(data[name])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+WRITE_SECONDS = metrics.histogram("db_write_seconds", "Store write latency, lock wait excluded", ["op"])
+
+class SyncedStore:
+    """
+    The one access layer for the bot's data, shared by the asyncio loop and
+    the dashboard's WSGI threads. Every store call runs under one re-entrant
+    lock, and callers hold `lock` around their in-memory mutation plus its
+    save so web and bot writes are serialized as whole units:
+
+        with store.lock:
+            db["ads"]["active"] = False
+            store.save_section(db, "ads")
+
+    Critical sections are dict updates and single-row writes, so the loop is
+    never held up for long.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # JsonStore snapshots from its flusher thread under this same lock.
+        self.lock = getattr(store, "lock", None) or threading.RLock()
+
+    def load(self):
+        with self.lock:
+            return self.store.load()
+
+    def save(self, data):
+        with self.lock, WRITE_SECONDS.time(op="save"):
+            self.store.save(data)
+
+    def save_group(self, data, gid):
+        with self.lock, WRITE_SECONDS.time(op="save_group"):
+            self.store.save_group(data, gid)
+
+    def save_groups(self, data, gids):
+        with self.lock, WRITE_SECONDS.time(op="save_groups"):
+            self.store.save_groups(data, gids)
+
+    def delete_group(self, data, gid):
+        with self.lock, WRITE_SECONDS.time(op="delete_group"):
+            self.store.delete_group(data, gid)
+
+    def save_user(self, data, user_id):
+        with self.lock, WRITE_SECONDS.time(op="save_user"):
+            self.store.save_user(data, user_id)
+
+    def save_section(self, data, name):
+        with self.lock, WRITE_SECONDS.time(op="save_section"):
+            self.store.save_section(data, name)
+
+    def close(self):
+        stop_flusher = getattr(self.store, "stop_flusher", None)
+        if stop_flusher is not None:
+            stop_flusher()
+        with self.lock:
+            self.store.close()
+
+def open_store():
+    if DB_BACKEND == "json":
+        return SyncedStore(JsonStore())
+    return SyncedStore(SQLiteStore())
@@ -0,0 +1,153 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from collections import deque
+
+from telethon import errors
+
+import broadcast
+import ratelimit
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+WORKERS = int(os.environ.get("DISPATCH_WORKERS", 16))
+SEND_TIMEOUT = float(os.environ.get("DISPATCH_SEND_TIMEOUT", 60))
+STALL_TIMEOUT = float(os.environ.get("DISPATCH_STALL_TIMEOUT", 5))    # a worker stops waiting on a send after this
+
+TIMEOUT = "timeout"
+
+DETACHED = metrics.counter("dispatch_sends_detached_total", "Sends a worker stopped waiting on after STALL_TIMEOUT")
+
+class _Job:
+    __slots__ = ("message", "key", "kwargs", "floods")
+
+    def __init__(self, message, key, kwargs):
+        self.message = message
+        self.key = key
+        self.kwargs = kwargs
+        self.floods = 0
+
+class Dispatcher:
+    """
+    Pool of send workers for scheduled group traffic (forwards, ads, promos).
+
+    Jobs are queued per chat and a chat has at most one send in flight, so
+    messages reach each chat in submission order. Workers never sleep on a
+    chat: a chat whose next slot (ratelimit.chat_limiter) is in the future, or
+    that got a FloodWaitError, is parked on a timer heap while the workers
+    serve chats that are ready. A send that takes longer than STALL_TIMEOUT
+    is left to finish on its own (bounded by SEND_TIMEOUT) and its worker moves
+    on. on_result(chat_id, key, outcome) is called after every job.
+    """
+
+    def __init__(self, client, workers=WORKERS, on_result=None):
+        self.client = client
+        self.workers = workers
+        self.on_result = on_result
+        self._pending = {}              # chat_id -> deque of _Job
+        self._depth = 0                 # jobs across all of _pending, kept so depth is O(1)
+        self._ready = asyncio.Queue()   # chats whose next send may start now
+        self._delayed = []              # heap of (ready_at, chat_id) waiting for their slot
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._timer()))
+
+    def submit(self, chat_id, message, key=None, **kwargs):
+        queue = self._pending.get(chat_id)
+        if queue is None:
+            queue = self._pending[chat_id] = deque()
+            self._schedule(chat_id)
+        queue.append(_Job(message, key, kwargs))
+        self._depth += 1
+
+    @property
+    def depth(self):
+        """Jobs waiting to be sent."""
+        return self._depth
+
+    def _schedule(self, chat_id):
+        """Queues the chat for a worker now, or parks it until its slot opens."""
+        ready_at = ratelimit.chat_limiter.ready_at(chat_id)
+        if ready_at <= time.monotonic():
+            self._ready.put_nowait(chat_id)
+        else:
+            heapq.heappush(self._delayed, (ready_at, chat_id))
+            self._wake.set()
+
+    async def _timer(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                self._ready.put_nowait(heapq.heappop(self._delayed)[1])
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            if ratelimit.chat_limiter.ready_at(chat_id) > time.monotonic():
+                self._schedule(chat_id)     # slot moved (e.g. a broadcast used it)
+                continue
+            ratelimit.chat_limiter.reserve(chat_id)
+            send = asyncio.create_task(self._send_next(chat_id))
+            done, _ = await asyncio.wait({send}, timeout=STALL_TIMEOUT)
+            if not done:
+                DETACHED.inc()
+                logger.warning(f"Send to {chat_id} still running after {STALL_TIMEOUT}s, worker moving on")
+
+    async def _send_next(self, chat_id):
+        queue = self._pending[chat_id]
+        job = queue[0]
+        try:
+            outcome = await asyncio.wait_for(
+                broadcast.send_once(self.client, chat_id, job.message, **job.kwargs), SEND_TIMEOUT)
+        except errors.FloodWaitError as e:
+            job.floods += 1
+            if job.floods <= broadcast.MAX_FLOOD_RETRIES:
+                # Only this chat waits; the global bucket and other chats carry on.
+                logger.warning(f"FloodWait {e.seconds}s for {chat_id}, rescheduling its queue")
+                ratelimit.chat_limiter.defer(chat_id, e.seconds)
+                self._schedule(chat_id)
+                return
+            outcome = broadcast.FAILED
+        except asyncio.TimeoutError:
+            logger.warning(f"Send to {chat_id} timed out after {SEND_TIMEOUT}s")
+            outcome = TIMEOUT
+        except Exception as e:
+            logger.error(f"Dispatch to {chat_id} failed: {e}")
+            outcome = broadcast.FAILED
+
+        queue.popleft()
+        self._depth -= 1
+        if outcome == broadcast.SENT and job.floods:
+            outcome = broadcast.FLOOD_RETRIED
+        broadcast.SENDS.inc(outcome=outcome)
+        self._report(chat_id, job.key, outcome)
+        if outcome in (broadcast.KICKED, broadcast.BLOCKED):
+            # Nothing else will get through to this chat
+            while queue:
+                self._depth -= 1
+                self._report(chat_id, queue.popleft().key, outcome)
+        if queue:
+            self._schedule(chat_id)
+        else:
+            del self._pending[chat_id]
+
+    def _report(self, chat_id, key, outcome):
+        if self.on_result is None: return
+        try:
+            self.on_result(chat_id, key, outcome)
+        except Exception as e:
+            logger.error(f"Dispatch result handler failed: {e}")
@@ -0,0 +1,71 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+from telethon import utils
+
+# --- CONFIGURATION ---
+ENTITY_CACHE_SIZE = int(os.environ.get("ENTITY_CACHE_SIZE", 10000))
+ENTITY_CACHE_TTL = int(os.environ.get("ENTITY_CACHE_TTL", 3600))   # names/usernames change, so refresh hourly
+
+class EntityCache:
+    """
+    Bounded LRU of resolved users (keyed by peer id) shared by the handlers, plus the
+    bot's own identity, fetched once. Concurrent lookups of the same id share
+    one get_entity request. Lookups accept anything get_entity does that has
+    a peer id (int, User, PeerUser, ...). Entities that arrive with updates can
+    be added with put() so they never need a lookup.
+    """
+
+    def __init__(self, client, maxsize=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL):
+        self.client = client
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.me = None
+        self._items = OrderedDict()   # id -> (expires_at, entity)
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_me(self):
+        if self.me is None:
+            self.me = await self.client.get_me()
+        return self.me
+
+    @property
+    def me_id(self):
+        """The bot's user id, or None until get_me() has run once."""
+        return self.me.id if self.me else None
+
+    def put(self, entity):
+        if entity is None or getattr(entity, "id", None) is None: return
+        key = utils.get_peer_id(entity)
+        self._items[key] = (time.monotonic() + self.ttl, entity)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    async def get(self, peer):
+        key = utils.get_peer_id(peer)
+        entry = self._items.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = self._inflight[key] = asyncio.ensure_future(self._fetch(key, peer))
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key, peer):
+        try:
+            entity = await self.client.get_entity(peer)
+            self.put(entity)
+            return entity
+        finally:
+            self._inflight.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
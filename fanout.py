@@ -0,0 +1,82 @@
+import logging
+from collections import OrderedDict
+
+from telethon import utils, types
+
+logger = logging.getLogger(__name__)
+
+MAX_PAYLOADS = 200
+
+class Payload:
+    """
+    A source post resolved once for sending to many chats.
+
+    Text and formatting entities are taken from the Message as-is (no parse
+    per send) and the media is turned into an InputMedia reference up front.
+    After the first successful media send the reference is swapped for the
+    copy the sending client now owns, so every later chat gets that file id
+    and nothing is re-uploaded or re-resolved.
+    Media that has no InputMedia form (e.g. a reposted story) is not resolved:
+    such posts are sent from the original Message, as before payloads existed.
+    """
+
+    def __init__(self, msg):
+        self.msg_id = msg.id
+        self.text = msg.message or ""
+        self.entities = msg.entities or []
+        self.buttons = msg.reply_markup
+        self.silent = msg.silent
+        self.link_preview = isinstance(msg.media, types.MessageMediaWebPage)
+        self.media = None
+        self.original = None
+        if msg.media and not self.link_preview:
+            try:
+                self.media = utils.get_input_media(msg.media)
+            except Exception as e:
+                logger.warning(f"Post {msg.id}: cannot resolve {type(msg.media).__name__} ({e}), sending the message as is")
+                self.original = msg
+        self._rebound = False
+
+    async def send(self, client, chat_id, **kwargs):
+        if self.original is not None:
+            return await client.send_message(chat_id, self.original, **kwargs)
+        if self.media is None:
+            return await client.send_message(
+                chat_id, self.text, formatting_entities=self.entities, link_preview=self.link_preview,
+                buttons=self.buttons, silent=self.silent, **kwargs)
+        sent = await client.send_file(
+            chat_id, self.media, caption=self.text, formatting_entities=self.entities,
+            buttons=self.buttons, silent=self.silent, **kwargs)
+        if not self._rebound and getattr(sent, "media", None):
+            self._rebound = True
+            try:
+                self.media = utils.get_input_media(sent.media)
+            except Exception as e:
+                logger.warning(f"Post {self.msg_id}: keeping the original media reference: {e}")
+        return sent
+
+class PayloadCache:
+    """Payloads keyed by source message id, oldest evicted past `maxsize`."""
+
+    def __init__(self, maxsize=MAX_PAYLOADS):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, msg):
+        payload = self._items.get(msg.id)
+        if payload is None:
+            payload = self._items[msg.id] = Payload(msg)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(msg.id)
+        return payload
+
+    def retain(self, msg_ids):
+        """Drops payloads for posts no longer in `msg_ids`."""
+        keep = set(msg_ids)
+        for msg_id in [k for k in self._items if k not in keep]:
+            del self._items[msg_id]
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,50 @@
+MAX_EXCEPTIONS = 50
+
+class DeliveryLedger:
+    """
+    Records which source posts each group already received, inside the
+    group's own settings so it is persisted with the group row:
+    - "last_msg_id": high-water mark; every post up to it was delivered
+    - "sent_ids": the few posts above the mark delivered out of order
+      (a post before them failed and will be retried)
+    Memory is O(groups) and a restart does not re-send anything.
+    """
+
+    def __init__(self, groups):
+        self.groups = groups
+
+    def delivered(self, gid, msg_id):
+        settings = self.groups.get(gid)
+        if settings is None:
+            return False
+        return msg_id <= settings.get("last_msg_id", 0) or msg_id in settings.get("sent_ids", ())
+
+    def record(self, gid, msg_id, post_ids):
+        """
+        Marks msg_id delivered to gid. post_ids are today's source post ids in
+        ascending order, used to move the mark past contiguous deliveries.
+        Returns True if the group's entry changed.
+        """
+        settings = self.groups.get(gid)
+        if settings is None:
+            return False
+        mark = settings.get("last_msg_id", 0)
+        if msg_id <= mark:
+            return False
+        extra = set(settings.get("sent_ids", ()))
+        extra.add(msg_id)
+        for post_id in post_ids:
+            if post_id <= mark: continue
+            if post_id not in extra: break
+            mark = post_id
+            extra.discard(post_id)
+        if len(extra) > MAX_EXCEPTIONS:
+            # Stop waiting on the oldest failures rather than grow without bound
+            mark = sorted(extra)[-MAX_EXCEPTIONS - 1]
+        settings["last_msg_id"] = mark
+        settings["sent_ids"] = sorted(i for i in extra if i > mark)
+        return True
+
+    def size(self):
+        """Entries held: one mark per group plus out-of-order ids."""
+        return sum(1 + len(settings.get("sent_ids", ())) for settings in self.groups.values())
@@ -1,43 +1,52 @@
 import os
 import asyncio
 import logging
-import json
 import re
 import time
+import signal
+import sys
+import functools
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 from threading import Thread
-from flask import Flask, request, render_template_string, redirect, url_for, session
 from telethon import TelegramClient, events, Button, functions, types
 from telethon.sessions import StringSession
-from telethon.tl.types import ChannelParticipantsAdmins
 
-# --- IMPORT SCRAPER ---
-import scraper
+# --- LOCAL MODULES ---
+# scraper/sources/pipeline (bs4) and Flask are imported by the components that use
+# them, so importing main stays cheap and side-effect free.
+import database
+import broadcast
+import scheduler
+import dispatch
+import ledger
+import fanout
+import admins
+import entities
+import metrics
 
 # --- LOGGING SETUP ---
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
+STARTED_AT = time.monotonic()   # startup phases and time-to-first-alert are measured from here
 
 # --- CONFIGURATION ---
 API_ID = os.environ.get("API_ID", "").strip()
 API_HASH = os.environ.get("API_HASH", "").strip()
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "").strip()
+BOT_ID = int(BOT_TOKEN.split(":")[0]) if BOT_TOKEN.split(":")[0].isdigit() else None   # bot tokens start with the bot's user id
 USER_SESSION = os.environ.get("USER_SESSION", "")
 
 # Web Dashboard Config
 WEB_PASSWORD = os.environ.get("WEB_PASSWORD", "admin123")
 SECRET_KEY = os.environ.get("SECRET_KEY", "supersecretkey")
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 4))
 
 # Support & Owner Links
 SUPPORT_GROUP = os.environ.get("SUPPORT_GROUP", "https://t.me/TushxEternal")
 SUPPORT_CHANNEL = os.environ.get("SUPPORT_CHANNEL", "https://t.me/SarkariJobDiscussions")
 OWNER_LINK = os.environ.get("OWNER_LINK", "https://t.me/Waitdaddy")
 
-# 1. CRITICAL: Check if Session exists
-if not USER_SESSION:
-    logger.critical("❌ ERROR: 'USER_SESSION' Environment Variable is MISSING.")
-    exit(1)
-
 USER_SESSION = USER_SESSION.strip().replace("\n", "").replace(" ", "")
 API_ID = int(API_ID) if API_ID.isdigit() else 0
 
@@ -52,57 +61,59 @@ LOG_CHANNEL = int(os.environ.get("LOG_CHANNEL", "0"))
 ADMIN_IDS = [int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x]
 
 # --- DATABASE ---
-DB_FILE = "database.json"
-SENT_MSGS = set()
-
-# Default Ad Config
-DEFAULT_AD = {
-    "active": False,
-    "content": "Advertise here!",
-    "interval": 60,
-    "limit": 0,
-    "sent": 0,
-    "last_sent": 0
-}
+# Storage lives in database.py: SQLite by default, DB_BACKEND=json keeps database.json.
+DEFAULT_AD = database.DEFAULT_AD
+IN_FLIGHT = set()       # (gid, msg_id) forwards queued on the dispatcher but not sent yet
+# Everything below is set by load_state() during startup(), not at import.
+store = None
+db = None
+group_schedule = None
+delivery_ledger = None
+ledger_dirty = set()
+job_store = None        # set once the job pipeline starts (see start_pipeline)
+broadcast_store = None
+running_broadcasts = {}
 
 def load_db():
-    default_db = {"groups": {}, "users": [], "ads": DEFAULT_AD, "settings": {"last_support_promo": 0}}
-    if not os.path.exists(DB_FILE):
-        return default_db
-    with open(DB_FILE, 'r') as f:
-        try:
-            data = json.load(f)
-            if isinstance(data.get("groups"), list):
-                new_groups = {}
-                for gid in data["groups"]:
-                    new_groups[str(gid)] = {"interval": 30, "last_post": 0, "active": True}
-                data["groups"] = new_groups
-            
-            if "ads" not in data: data["ads"] = DEFAULT_AD
-            if "settings" not in data: data["settings"] = {"last_support_promo": 0}
-            return data
-        except:
-            return default_db
+    return store.load()
 
 def save_db(data):
-    with open(DB_FILE, 'w') as f:
-        json.dump(data, f)
+    store.save(data)
 
-db = load_db()
+def load_state():
+    """Opens the stores and loads the bot's data. Runs on a worker thread during startup()."""
+    global store, db, group_schedule, delivery_ledger, broadcast_store
+    store = database.open_store()
+    db = load_db()
+    group_schedule = scheduler.GroupSchedule(db["groups"])
+    delivery_ledger = ledger.DeliveryLedger(db["groups"])
+    broadcast_store = broadcast.BroadcastStore()
 
 # --- INITIALIZATION ---
-logger.info("--- Starting Job Alert Bot ---")
-try:
-    user_client = TelegramClient(StringSession(USER_SESSION), API_ID, API_HASH)
-    bot_client = TelegramClient('bot_session', API_ID, API_HASH).start(bot_token=BOT_TOKEN)
-except Exception as e:
-    logger.critical(f"❌ Failed to initialize Telegram Clients: {e}")
-    exit(1)
+# Set by create_app(); nothing connects until startup().
+user_client = None
+bot_client = None
+admin_cache = None
+entity_cache = None
+dispatcher = None
+chat_action_stats = Counter()   # ChatAction events passed to on_join vs dropped by its filter
+
+def create_app(user=None, bot=None):
+    """
+    Builds the Telegram clients and everything bound to them, without any
+    network or disk I/O. Pre-built clients can be passed in (bench/loadtest.py
+    uses fakes).
+    """
+    global user_client, bot_client, admin_cache, entity_cache, dispatcher
+    user_client = user or TelegramClient(StringSession(USER_SESSION), API_ID, API_HASH)
+    bot_client = bot or TelegramClient('bot_session', API_ID, API_HASH)
+    admin_cache = admins.AdminCache(bot_client)
+    entity_cache = entities.EntityCache(bot_client)
+    dispatcher = dispatch.Dispatcher(bot_client, on_result=on_dispatch_result)
+    register_handlers()     # before connecting, so no update arrives without a handler
+    return user_client, bot_client
 
 # --- FLASK APP ---
-app = Flask(__name__)
-app.secret_key = SECRET_KEY
-
 HTML_LOGIN = """
 <!doctype html>
 <title>Login</title>
@@ -122,7 +133,7 @@ HTML_DASHBOARD = """
 label{display:block;margin-top:1rem;font-weight:bold}
 input,textarea{width:100%;padding:0.5rem;margin-top:0.5rem;border:1px solid #ddd;border-radius:4px}
 button{background:#28a745;color:white;border:none;padding:0.75rem 1.5rem;margin-top:1rem;cursor:pointer;border-radius:4px}
-.stats{display:grid;grid-template-columns:1fr 1fr 1fr;gap:1rem}
+.stats{display:grid;grid-template-columns:1fr 1fr 1fr 1fr;gap:1rem}
 .stat{text-align:center;background:#eef;padding:1rem;border-radius:4px}
 </style>
 <h1>📢 Ad Manager</h1>
@@ -130,6 +141,7 @@ button{background:#28a745;color:white;border:none;padding:0.75rem 1.5rem;margin-
     <div class="stat"><h3>{{ groups }}</h3><small>Active Groups</small></div>
     <div class="stat"><h3>{{ users }}</h3><small>Active Users</small></div>
     <div class="stat"><h3>{{ ad_sent }} / {{ ad_limit }}</h3><small>Ads Sent</small></div>
+    <div class="stat"><h3>{{ joins_dropped }} / {{ joins_total }}</h3><small>Join Events Skipped</small></div>
 </div>
 
 <form method=post class="card">
@@ -151,81 +163,109 @@ button{background:#28a745;color:white;border:none;padding:0.75rem 1.5rem;margin-
 </form>
 """
 
-@app.route('/', methods=['GET', 'POST'])
-def dashboard():
-    if request.method == 'POST':
-        if request.form.get('password') == WEB_PASSWORD:
-            session['logged_in'] = True
-            return redirect(url_for('manager'))
-        else:
-            return "Invalid Password"
+def create_web_app():
+    """Builds the dashboard app. Flask is imported here, on the web thread."""
+    from flask import Flask, request, render_template_string, redirect, url_for, session
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+
+    @app.route('/', methods=['GET', 'POST'])
+    def dashboard():
+        if request.method == 'POST':
+            if request.form.get('password') == WEB_PASSWORD:
+                session['logged_in'] = True
+                return redirect(url_for('manager'))
+            else:
+                return "Invalid Password"
             
-    if session.get('logged_in'): return redirect(url_for('manager'))
-    return render_template_string(HTML_LOGIN)
+        if session.get('logged_in'): return redirect(url_for('manager'))
+        return render_template_string(HTML_LOGIN)
 
-@app.route('/manager', methods=['GET', 'POST'])
-def manager():
-    if not session.get('logged_in'): return redirect(url_for('dashboard'))
+    @app.route('/manager', methods=['GET', 'POST'])
+    def manager():
+        if not session.get('logged_in'): return redirect(url_for('dashboard'))
+        if db is None: return "Starting up, try again in a moment.", 503
     
-    if request.method == 'POST':
-        db['ads']['content'] = request.form.get('content')
-        db['ads']['interval'] = int(request.form.get('interval', 60))
-        db['ads']['limit'] = int(request.form.get('limit', 0))
-        db['ads']['active'] = 'active' in request.form
-        save_db(db)
-        return redirect(url_for('manager'))
-
-    return render_template_string(HTML_DASHBOARD, 
-        groups=len(db['groups']), 
-        users=len(db['users']),
-        ad_content=db['ads']['content'],
-        ad_interval=db['ads']['interval'],
-        ad_limit=db['ads']['limit'],
-        ad_active=db['ads']['active'],
-        ad_sent=db['ads']['sent']
-    )
+        if request.method == 'POST':
+            interval = int(request.form.get('interval', 60))
+            limit = int(request.form.get('limit', 0))
+            with store.lock:
+                db['ads']['content'] = request.form.get('content')
+                db['ads']['interval'] = interval
+                db['ads']['limit'] = limit
+                db['ads']['active'] = 'active' in request.form
+                store.save_section(db, 'ads')
+            return redirect(url_for('manager'))
+
+        with store.lock:
+            stats = dict(
+                groups=len(db['groups']), 
+                users=len(db['users']) - len(db['users'].blocked),
+                ad_content=db['ads']['content'],
+                ad_interval=db['ads']['interval'],
+                ad_limit=db['ads']['limit'],
+                ad_active=db['ads']['active'],
+                ad_sent=db['ads']['sent']
+            )
+        return render_template_string(HTML_DASHBOARD, 
+            joins_dropped=chat_action_stats['dropped'],
+            joins_total=sum(chat_action_stats.values()),
+            **stats
+        )
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+    return app
 
 def run_web():
     port = int(os.environ.get("PORT", 8080))
-    app.run(host="0.0.0.0", port=port)
+    app = create_web_app()
+    try:
+        from waitress import serve
+    except ImportError:
+        logger.warning("⚠️ waitress not installed, falling back to Flask's development server.")
+        app.run(host="0.0.0.0", port=port)
+        return
+    serve(app, host="0.0.0.0", port=port, threads=WEB_THREADS)
 
 # --- HELPER FUNCTIONS ---
 
+ADMIN_CHECK_SECONDS = metrics.histogram("is_admin_seconds", "Admin check latency")
+
+@ADMIN_CHECK_SECONDS.time()
 async def is_admin(chat_id, user_id):
     """
     Robust Admin Check:
     1. Checks if user is Global Bot Owner (ADMIN_IDS)
     2. Checks if user is Anonymous Admin (Group ID = User ID)
-    3. Fetches FULL Admin list from Telegram to verify user ID
+    3. Checks the chat's admin list (cached per chat, see admins.py)
     """
     if user_id in ADMIN_IDS:
         return True
     if user_id == chat_id:
         return True
     try:
-        admins = await bot_client.get_participants(chat_id, filter=ChannelParticipantsAdmins)
-        admin_ids = [admin.id for admin in admins]
-        if user_id in admin_ids:
-            return True
-        chat = await bot_client.get_entity(chat_id)
-        if hasattr(chat, 'creator') and chat.creator:
-             pass
+        return await admin_cache.is_admin(chat_id, user_id)
     except Exception as e:
         logger.warning(f"Admin check warning for {user_id} in {chat_id}: {e}")
     return False
 
 def update_group(chat_id, action="add"):
     str_id = str(chat_id)
-    if action == "add":
-        if str_id not in db["groups"]:
-            db["groups"][str_id] = {"interval": 30, "last_post": 0, "active": True}
-            save_db(db)
-            return True
-    elif action == "remove":
-        if str_id in db["groups"]:
-            del db["groups"][str_id]
-            save_db(db)
-            return True
+    with store.lock:
+        if action == "add":
+            if str_id not in db["groups"]:
+                db["groups"][str_id] = dict(database.DEFAULT_GROUP)
+                store.save_group(db, str_id)
+                group_schedule.update(str_id)
+                return True
+        elif action == "remove":
+            if str_id in db["groups"]:
+                del db["groups"][str_id]
+                store.delete_group(db, str_id)
+                return True
     return False
 
 async def setup_bot_commands():
@@ -246,7 +286,9 @@ async def setup_bot_commands():
         owner_commands = public_commands + [
             types.BotCommand("broadcast", "Broadcast All"),
             types.BotCommand("broadcastg", "Broadcast Groups"),
-            types.BotCommand("broadcastp", "Broadcast Users")
+            types.BotCommand("broadcastp", "Broadcast Users"),
+            types.BotCommand("bstatus", "Broadcast Jobs"),
+            types.BotCommand("bcancel", "Cancel Broadcast")
         ]
         
         for admin_id in ADMIN_IDS:
@@ -265,7 +307,7 @@ async def setup_bot_commands():
 
 async def get_user_info(user_id):
     try:
-        u = await bot_client.get_entity(user_id)
+        u = await entity_cache.get(user_id)
         username = f"@{u.username}" if u.username else "No Username"
         return f"👤 **Name:** {u.first_name} {u.last_name or ''}\n🆔 **ID:** `{u.id}`\n🔗 **Username:** {username}"
     except:
@@ -273,10 +315,9 @@ async def get_user_info(user_id):
 
 # --- BOT HANDLERS ---
 
-@bot_client.on(events.NewMessage(pattern='/start'))
 async def start_handler(event):
     chat_id = event.chat_id
-    me = await bot_client.get_me()
+    me = await entity_cache.get_me()
     
     buttons = [
         [Button.url("📢 Support Channel", SUPPORT_CHANNEL), Button.url("👥 Support Group", SUPPORT_GROUP)],
@@ -285,9 +326,11 @@ async def start_handler(event):
     ]
 
     if event.is_private:
-        if event.sender_id not in db["users"]:
-            db["users"].append(event.sender_id)
-            save_db(db)
+        with store.lock:
+            is_new = db["users"].add(event.sender_id)
+            store.save_user(db, event.sender_id)
+        if is_new:
+            entity_cache.put(event.sender)
             try:
                 user_info = await get_user_info(event.sender_id)
                 await bot_client.send_message(LOG_CHANNEL, f"🆕 **New User Started Bot**\n\n{user_info}")
@@ -317,7 +360,6 @@ async def start_handler(event):
         else:
             await event.respond("⚠️ **Action Required:** Make me **Admin** to receive alerts.")
 
-@bot_client.on(events.NewMessage(pattern='/set'))
 async def set_interval(event):
     if event.is_private: return
     
@@ -338,8 +380,10 @@ async def set_interval(event):
             
         str_id = str(event.chat_id)
         if str_id in db["groups"]:
-            db["groups"][str_id]["interval"] = mins
-            save_db(db)
+            with store.lock:
+                db["groups"][str_id]["interval"] = mins
+                store.save_group(db, str_id)
+                group_schedule.update(str_id)
             await event.respond(f"✅ Interval set to **{mins} minutes**.")
         else:
             await event.respond("⚠️ Bot not active. Type `/start` first.")
@@ -347,7 +391,6 @@ async def set_interval(event):
     except ValueError:
         await event.respond("❌ Please enter a valid number.")
 
-@bot_client.on(events.NewMessage(pattern='/stop'))
 async def stop_handler(event):
     if not event.is_private:
         if not (await is_admin(event.chat_id, event.sender_id)):
@@ -356,92 +399,116 @@ async def stop_handler(event):
             
     if event.is_private:
         if event.sender_id in db["users"]:
-             db["users"].remove(event.sender_id)
-             save_db(db)
+             with store.lock:
+                 db["users"].remove(event.sender_id)
+                 store.save_user(db, event.sender_id)
              await event.respond("🔕 Stopped.")
     else:
         update_group(event.chat_id, "remove")
         await event.respond("🔕 **Stopped.** Type `/start` to resume.")
 
-@bot_client.on(events.ChatAction)
+async def on_participant_update(update):
+    admin_cache.on_update(update)
+
+def bot_chat_action(event):
+    """
+    ChatAction pre-filter, run by Telethon before on_join is called. It
+    decides from event fields alone (no awaits, no API calls) whether the bot
+    itself was added; everything else is counted as dropped. Leaves and kicks
+    only invalidate the admin cache here.
+    """
+    if event.user_left or event.user_kicked:
+        admin_cache.invalidate(event.chat_id)
+    if (event.user_added or event.user_joined) and (entity_cache.me_id or BOT_ID) in (event.user_ids or ()):
+        chat_action_stats["handled"] += 1
+        return True
+    chat_action_stats["dropped"] += 1
+    return False
+
 async def on_join(event):
-    if event.user_added or event.user_joined:
-        if event.user_id == (await bot_client.get_me()).id:
-            chat = await event.get_chat()
-            await bot_client.send_message(
-                chat.id, 
-                "👋 **Hi!** Promote me to **Admin** and type `/start`.",
-                buttons=[Button.url("👤 Owner", OWNER_LINK)]
-            )
-            try:
-                try:
-                    invite = await bot_client(functions.messages.ExportChatInviteRequest(chat.id))
-                    link = invite.link
-                except: link = "No Link (Bot needs Admin)"
+    chat = await event.get_chat()
+    await bot_client.send_message(
+        chat.id, 
+        "👋 **Hi!** Promote me to **Admin** and type `/start`.",
+        buttons=[Button.url("👤 Owner", OWNER_LINK)]
+    )
+    try:
+        try:
+            invite = await bot_client(functions.messages.ExportChatInviteRequest(chat.id))
+            link = invite.link
+        except: link = "No Link (Bot needs Admin)"
                 
-                added_by_info = "Unknown"
-                if event.added_by:
-                    added_by_info = await get_user_info(event.added_by)
+        added_by_info = "Unknown"
+        if event.added_by:
+            added_by_info = await get_user_info(event.added_by)
                 
-                log_msg = (
-                    f"➕ **Bot Added to Group**\n\n"
-                    f"📛 **Group:** {chat.title}\n"
-                    f"🆔 **Group ID:** `{chat.id}`\n"
-                    f"🔗 **Link:** {link}\n\n"
-                    f"👮 **Added By:**\n{added_by_info}"
-                )
-                await bot_client.send_message(LOG_CHANNEL, log_msg)
-            except Exception as e:
-                logger.error(f"Log Error: {e}")
+        log_msg = (
+            f"➕ **Bot Added to Group**\n\n"
+            f"📛 **Group:** {chat.title}\n"
+            f"🆔 **Group ID:** `{chat.id}`\n"
+            f"🔗 **Link:** {link}\n\n"
+            f"👮 **Added By:**\n{added_by_info}"
+        )
+        await bot_client.send_message(LOG_CHANNEL, log_msg)
+    except Exception as e:
+        logger.error(f"Log Error: {e}")
 
 # --- SCRAPER HANDLER ---
 
-@bot_client.on(events.NewMessage(pattern='/fetch'))
+def format_job(details):
+    """Builds the /fetch message text and link buttons for a parsed job."""
+    response_text = f"🔥 **{details['title']}**\n\n"
+    
+    if details['dates']:
+        response_text += "📅 **Dates:**\n" + "\n".join([f"• {x}" for x in details['dates'][:3]]) + "\n\n"
+        
+    if details['fees']:
+        response_text += "💰 **Fees:**\n" + "\n".join([f"• {x}" for x in details['fees'][:3]]) + "\n\n"
+
+    buttons = []
+    for label, link in details['links'].items():
+        buttons.append([Button.url(label, link)])
+    return response_text, buttons
+
 async def fetch_handler(event):
-    """Fetches the latest job from the website using scraper.py"""
+    """Fetches the latest job from the job sites (see sources.py)"""
     # Optional: Restrict to admins or specific users
     if not event.is_private and not await is_admin(event.chat_id, event.sender_id):
          await event.respond("❌ Only Admins can use this.")
          return
 
-    msg = await event.respond("🔍 **Scanning Sarkari Result...**")
+    # 1. Serve the newest job already parsed by the background pipeline
+    latest = job_store.latest() if job_store else None
+    if latest:
+        response_text, buttons = format_job(latest['details'])
+        await event.respond(response_text, buttons=buttons)
+        return
+
+    # 2. Nothing ingested yet (fresh start): crawl the job sites inline
+    import sources
+    msg = await event.respond("🔍 **Scanning job sites...**")
     
-    # 1. Get List
-    jobs = scraper.get_latest_jobs()
+    jobs = await sources.crawl(limit=1)
     if not jobs:
         await msg.edit("❌ Could not fetch jobs from website.")
         return
 
-    # 2. Get Details of the very latest job
     latest_job = jobs[0]
     await msg.edit(f"📥 **Fetching details for:**\n`{latest_job['title']}`")
     
-    details = scraper.get_job_details(latest_job['url'])
+    details = await sources.get(latest_job['source']).details(latest_job['url'])
     
     if not details:
         await msg.edit("❌ Failed to parse details.")
         return
 
-    # 3. Format Message
-    response_text = f"🔥 **{details['title']}**\n\n"
-    
-    if details['dates']:
-        response_text += "📅 **Dates:**\n" + "\n".join([f"• {x}" for x in details['dates'][:3]]) + "\n\n"
-        
-    if details['fees']:
-        response_text += "💰 **Fees:**\n" + "\n".join([f"• {x}" for x in details['fees'][:3]]) + "\n\n"
-
-    buttons = []
-    for label, link in details['links'].items():
-        buttons.append([Button.url(label, link)])
-
+    response_text, buttons = format_job(details)
     await msg.delete()
     await event.respond(response_text, buttons=buttons)
 
 
 # --- SCHEDULER & BROADCAST ---
 
-@bot_client.on(events.NewMessage(pattern='/broadcast'))
 async def broadcast_handler(event):
     if event.sender_id not in ADMIN_IDS: return
     if not event.reply_to_msg_id:
@@ -453,92 +520,403 @@ async def broadcast_handler(event):
     
     targets = []
     if command == "/broadcastg": targets = list(db["groups"].keys())
-    elif command == "/broadcastp": targets = db["users"]
-    else: targets = list(db["groups"].keys()) + db["users"]
+    elif command == "/broadcastp": targets = db["users"].active()
+    else: targets = list(db["groups"].keys()) + db["users"].active()
     
     msg = await event.respond(f"🚀 Sending to {len(targets)} targets...")
-    count = 0
-    for chat_id in targets:
+    job_id = broadcast_store.create(targets, event.chat_id, reply_msg.id, msg.chat_id, msg.id)
+    await run_broadcast_job(broadcast_store.get(job_id), reply_msg)
+
+async def run_broadcast_job(job, message):
+    """Runs (or resumes) a persisted broadcast, reporting progress in its status message."""
+    async def show_progress(b):
+        await bot_client.edit_message(job["status_chat"], job["status_msg"],
+            f"🚀 Broadcast #{job['id']}... {b.done}/{b.total}\n\n{b.summary()}")
+
+    b = broadcast.Broadcast.resume(bot_client, broadcast_store, job, fanout.Payload(message))
+    running_broadcasts[job["id"]] = b
+    try:
+        await b.run(on_progress=show_progress)
+    finally:
+        running_broadcasts.pop(job["id"], None)
+
+    # Drop dead recipients so later broadcasts skip them
+    with store.lock:
+        for target, outcome in b.outcomes.items():
+            if outcome == broadcast.BLOCKED:
+                db["users"].mark_blocked(int(target))
+            elif outcome == broadcast.KICKED and str(target) in db["groups"]:
+                db["groups"][str(target)]["active"] = False
+        save_db(db)
+
+    state = "cancelled" if b.cancelled else "finished"
+    try:
+        await bot_client.edit_message(job["status_chat"], job["status_msg"],
+            f"📢 **Broadcast #{job['id']} {state}**\n\n{b.summary()}")
+    except Exception as e:
+        logger.warning(f"Could not update broadcast status: {e}")
+
+async def resume_broadcasts():
+    """Picks up broadcasts that were still running when the bot last stopped."""
+    broadcast_store.prune()
+    for job in broadcast_store.running():
         try:
-            await bot_client.send_message(int(chat_id), reply_msg)
-            count += 1
-            await asyncio.sleep(0.1)
-        except: pass
-    await msg.edit(f"✅ Sent to {count} recipients.")
+            message = await bot_client.get_messages(job["source_chat"], ids=job["source_msg"])
+        except Exception as e:
+            logger.error(f"Broadcast #{job['id']}: source message unavailable: {e}")
+            message = None
+        if not message:
+            broadcast_store.finish(job["id"], "failed")
+            continue
+        logger.info(f"🔁 Resuming broadcast #{job['id']} ({job['cursor']}/{job['total']} done)")
+        asyncio.create_task(run_broadcast_job(job, message))
+
+async def broadcast_status_handler(event):
+    if event.sender_id not in ADMIN_IDS: return
+    jobs = broadcast_store.recent()
+    if not jobs:
+        await event.respond("No broadcasts yet.")
+        return
+    lines = []
+    for job in jobs:
+        live = running_broadcasts.get(job["id"])
+        done = live.done if live else job["cursor"]
+        lines.append(f"#{job['id']} • {job['state']} • {done}/{job['total']}")
+    await event.respond("📋 **Broadcasts**\n\n" + "\n".join(lines) + "\n\nCancel: `/bcancel <id>`")
+
+async def broadcast_cancel_handler(event):
+    if event.sender_id not in ADMIN_IDS: return
+    args = event.text.split()
+    if len(args) < 2 or not args[1].isdigit():
+        await event.respond("Usage: `/bcancel 12`")
+        return
+    job_id = int(args[1])
+    job = broadcast_store.get(job_id)
+    if not job or job["state"] != "running":
+        await event.respond("⚠️ No running broadcast with that id.")
+        return
+    if job_id in running_broadcasts:
+        running_broadcasts[job_id].cancel()
+    else:
+        broadcast_store.finish(job_id, "cancelled")
+    await event.respond(f"🛑 Broadcast #{job_id} cancelled.")
+
+# --- SOURCE CHANNEL FEED ---
+# New posts are pushed by a NewMessage handler on user_client. Polling is only
+# a gap-filler: once at startup (today's posts) and after a reconnect, from the
+# last message id seen while connected.
+IST = timezone(timedelta(hours=5, minutes=30))
+GAP_CHECK_INTERVAL = 30
+GAP_FILL_INTERVAL = int(os.environ.get("GAP_FILL_INTERVAL", 1800))
+post_queue = asyncio.Queue()
+recent_posts = []       # today's source posts, oldest first
+recent_ids = set()
+payloads = fanout.PayloadCache()    # each post resolved once, then sent to every group from it
+last_source_id = 0
+posts_added = 0         # bumped per new post; wakes parked groups
+
+async def on_source_post(event):
+    post_queue.put_nowait(event.message)
+
+def add_post(msg):
+    """Adds a source post to today's list, ignoring duplicates from push + poll."""
+    global last_source_id, posts_added
+    if not msg.date or msg.id in recent_ids: return
+    if msg.date.astimezone(IST).date() < datetime.now(IST).date(): return
+    recent_ids.add(msg.id)
+    recent_posts.append(msg)
+    if msg.id < last_source_id:
+        recent_posts.sort(key=lambda m: m.id)
+    last_source_id = max(last_source_id, msg.id)
+    posts_added += 1
+
+def collect_posts():
+    """Drains the queue into recent_posts and drops posts from previous days."""
+    while not post_queue.empty():
+        add_post(post_queue.get_nowait())
+    today = datetime.now(IST).date()
+    if recent_posts and recent_posts[0].date.astimezone(IST).date() < today:
+        recent_posts[:] = [m for m in recent_posts if m.date.astimezone(IST).date() >= today]
+        recent_ids.intersection_update(m.id for m in recent_posts)
+        payloads.retain(recent_ids)
+
+async def fill_gaps(min_id):
+    """Enqueues today's posts newer than min_id (at most 20, like the old poll)."""
+    today = datetime.now(IST).date()
+    missed = []
+    async for msg in user_client.iter_messages(SOURCE_CHANNEL, limit=20, min_id=min_id):
+        if not msg.date: continue
+        if msg.date.astimezone(IST).date() < today: break
+        missed.append(msg)
+    for msg in reversed(missed):
+        post_queue.put_nowait(msg)
+    return len(missed)
+
+async def gap_filler():
+    synced_id = 0           # everything up to here was received while connected
+    was_connected = False
+    last_fill = 0
+    while True:
+        try:
+            connected = user_client.is_connected()
+            if connected and (not was_connected or time.time() - last_fill >= GAP_FILL_INTERVAL):
+                found = await fill_gaps(synced_id)
+                last_fill = time.time()
+                if found: logger.info(f"🧩 Gap filler recovered {found} source posts.")
+            if connected:
+                synced_id = max(synced_id, last_source_id)
+            was_connected = connected
+        except Exception as e:
+            logger.error(f"Gap Filler Error: {e}")
+        await asyncio.sleep(GAP_CHECK_INTERVAL)
+
+def next_wakeup(now):
+    """Earliest of: next group due, next ad slot, next daily promo."""
+    deadlines = [db["settings"].get("last_support_promo", 0) + 86400]
+    group_due = group_schedule.next_due()
+    if group_due is not None: deadlines.append(group_due)
+    ad = db.get("ads", DEFAULT_AD)
+    if ad.get("active") and ad["sent"] < ad["limit"]:
+        deadlines.append(ad.get("last_sent", 0) + ad["interval"] * 60)
+    return min(deadlines)
+
+def on_dispatch_result(gid, key, outcome):
+    """Bookkeeping for each finished dispatcher send."""
+    with store.lock:
+        if key is not None:
+            IN_FLIGHT.discard(key)
+            if outcome in (broadcast.SENT, broadcast.FLOOD_RETRIED):
+                mark_startup("first_alert")
+                if delivery_ledger.record(gid, key[1], [m.id for m in recent_posts]):
+                    ledger_dirty.add(gid)
+                    if len(ledger_dirty) >= 200 or dispatcher.depth == 0:
+                        flush_ledger()
+        if outcome == broadcast.KICKED:
+            settings = db["groups"].get(gid)
+            if settings and settings.get("active", True):
+                settings["active"] = False
+                store.save_group(db, gid)
+
+def flush_ledger():
+    """Persists delivery marks in one batch (every 200 groups or when the dispatcher drains)."""
+    if ledger_dirty:
+        store.save_groups(db, list(ledger_dirty))
+        ledger_dirty.clear()
+
+# --- METRICS ---
+SCHEDULER_PASS_SECONDS = metrics.histogram("scheduler_pass_seconds", "Duration of one global_scheduler pass")
+SCHEDULER_ERRORS = metrics.counter("scheduler_errors_total", "global_scheduler passes that raised")
+
+def loaded(func):
+    """Gauge callback that reads 0 until startup() has loaded the state it needs."""
+    return lambda: func() if db is not None and dispatcher is not None else 0
+
+metrics.gauge("groups", "Registered groups", loaded(lambda: len(db["groups"])))
+metrics.gauge("groups_scheduled", "Active groups on the schedule heap or parked", loaded(lambda: len(group_schedule)))
+metrics.gauge("users_active", "Users that have not blocked the bot", loaded(lambda: len(db["users"]) - len(db["users"].blocked)))
+metrics.gauge("dispatch_queue_depth", "Sends waiting on the dispatcher", loaded(lambda: dispatcher.depth))
+metrics.gauge("forwards_in_flight", "Forwards queued but not finished", lambda: len(IN_FLIGHT))
+metrics.gauge("delivery_ledger_size", "Entries tracked by the delivery ledger", loaded(lambda: delivery_ledger.size()))
+metrics.gauge("source_posts_today", "Source posts kept for forwarding", lambda: len(recent_posts))
+metrics.gauge("source_queue_depth", "Source posts waiting to be collected", lambda: post_queue.qsize())
+metrics.gauge("broadcasts_running", "Broadcasts in progress", lambda: len(running_broadcasts))
+metrics.gauge("admin_cache_chats", "Chats with a cached admin list", loaded(lambda: len(admin_cache)))
+metrics.gauge("entity_cache_size", "Users in the entity cache", loaded(lambda: len(entity_cache)))
+metrics.gauge("startup_ready_seconds", "Seconds from process start until handlers and the scheduler were live",
+              lambda: startup_times.get("ready", 0))
+metrics.gauge("time_to_first_alert_seconds", "Seconds from process start until the first alert was forwarded",
+              lambda: startup_times.get("first_alert", 0))
+metrics.counter("chat_actions_dropped_total", "ChatAction events dropped by the pre-filter", func=lambda: chat_action_stats["dropped"])
+metrics.counter("chat_actions_handled_total", "ChatAction events passed to on_join", func=lambda: chat_action_stats["handled"])
 
 async def global_scheduler():
     logger.info("⏳ Scheduler Started...")
+    dispatcher.start()
+    seen_posts = 0
     while True:
+        pass_started = time.perf_counter()
         try:
+            collect_posts()
             now = time.time()
-            ist_offset = timezone(timedelta(hours=5, minutes=30))
-            today = datetime.now(ist_offset).date()
-            recent_posts = []
-            
-            async for msg in user_client.iter_messages(SOURCE_CHANNEL, limit=20):
-                if not msg.date: continue
-                msg_date = msg.date.astimezone(ist_offset).date()
-                if msg_date < today: break
-                recent_posts.append(msg)
-            
-            recent_posts.reverse()
 
-            for gid, settings in db["groups"].items():
-                if not settings.get("active", True): continue
-                last_post = settings.get("last_post", 0)
-                interval_sec = settings.get("interval", 30) * 60
-                
-                if now - last_post >= interval_sec:
-                    sent_something = False
-                    for msg in recent_posts:
-                        cache_key = f"{gid}_{msg.id}"
-                        if cache_key in SENT_MSGS: continue
-                        try:
-                            await bot_client.send_message(int(gid), msg)
-                            SENT_MSGS.add(cache_key)
-                            sent_something = True
-                            await asyncio.sleep(0.5)
-                        except Exception as e:
-                            if "permission" in str(e).lower(): settings["active"] = False
-                    
-                    if sent_something: db["groups"][gid]["last_post"] = now
-            
-            ad = db.get("ads", DEFAULT_AD)
-            if ad.get("active"):
-                if now - ad.get("last_sent", 0) >= (ad["interval"] * 60):
-                    if ad["sent"] < ad["limit"]:
-                        for gid in db["groups"]:
-                            try: await bot_client.send_message(int(gid), ad["content"], parse_mode='html')
-                            except: pass
-                        ad["sent"] += 1
-                        ad["last_sent"] = now
-            
-            last_promo = db["settings"].get("last_support_promo", 0)
-            if now - last_promo >= 86400:
-                promo_text = f"📢 **Daily Reminder:**\nJoin our Support Group!\n{SUPPORT_GROUP}"
-                for gid in db["groups"]:
-                    try: await bot_client.send_message(int(gid), promo_text)
-                    except: pass
-                db["settings"]["last_support_promo"] = now
-            
-            save_db(db)
-            await asyncio.sleep(60)
+            with store.lock:   # the dashboard edits ads from its own threads
+                # Only groups whose deadline passed, plus parked ones if a post arrived
+                due = group_schedule.pop_due(now)
+                if posts_added != seen_posts:
+                    seen_posts = posts_added
+                    due += group_schedule.take_idle()
+
+                touched = []
+                for gid in due:
+                    settings = db["groups"].get(gid)
+                    if not settings or not settings.get("active", True): continue
+                    queued_something = False
+                    # pop_due/take_idle took the group off the schedule: whatever
+                    # happens here, it has to go back on (or be parked).
+                    try:
+                        for msg in recent_posts:
+                            cache_key = (gid, msg.id)
+                            if cache_key in IN_FLIGHT or delivery_ledger.delivered(gid, msg.id): continue
+                            dispatcher.submit(gid, payloads.get(msg), key=cache_key)
+                            IN_FLIGHT.add(cache_key)
+                            queued_something = True
+                    except Exception as e:
+                        SCHEDULER_ERRORS.inc()
+                        logger.error(f"Scheduler Error for group {gid}: {e}")
+                    finally:
+                        if queued_something:
+                            settings["last_post"] = now
+                            touched.append(gid)
+                            group_schedule.update(gid)
+                        else:
+                            group_schedule.park(gid)
+                if touched: store.save_groups(db, touched)
+
+                ad = db.get("ads", DEFAULT_AD)
+                if ad.get("active"):
+                    if now - ad.get("last_sent", 0) >= (ad["interval"] * 60):
+                        if ad["sent"] < ad["limit"]:
+                            for gid in db["groups"]:
+                                dispatcher.submit(gid, ad["content"], parse_mode='html')
+                            ad["sent"] += 1
+                            ad["last_sent"] = now
+                            store.save_section(db, "ads")
             
+                last_promo = db["settings"].get("last_support_promo", 0)
+                if now - last_promo >= 86400:
+                    promo_text = f"📢 **Daily Reminder:**\nJoin our Support Group!\n{SUPPORT_GROUP}"
+                    for gid in db["groups"]:
+                        dispatcher.submit(gid, promo_text)
+                    db["settings"]["last_support_promo"] = now
+                    store.save_section(db, "settings")
         except Exception as e:
+            SCHEDULER_ERRORS.inc()
             logger.error(f"Scheduler Error: {e}")
-            await asyncio.sleep(60)
+        finally:
+            SCHEDULER_PASS_SECONDS.observe(time.perf_counter() - pass_started)
 
-if __name__ == '__main__':
+        # Sleep until the next deadline, or until a new source post arrives
+        try:
+            timeout = min(max(next_wakeup(time.time()) - time.time(), 1), 3600)
+        except Exception:
+            timeout = 60
+        try:
+            add_post(await asyncio.wait_for(post_queue.get(), timeout=timeout))
+        except asyncio.TimeoutError:
+            pass
+
+# --- STARTUP ---
+startup_times = {}      # phase -> seconds after STARTED_AT, first occurrence only
+
+def mark_startup(phase):
+    if phase in startup_times: return
+    startup_times[phase] = time.monotonic() - STARTED_AT
+    logger.info(f"⏱️ Startup: {phase} after {startup_times[phase]:.2f}s")
+
+def check_config():
+    if not USER_SESSION:
+        logger.critical("❌ ERROR: 'USER_SESSION' Environment Variable is MISSING.")
+        return False
+    return True
+
+def needs_state(handler):
+    """Wraps a handler that reads the database: until load_state() has run it only says so."""
+    @functools.wraps(handler)
+    async def wrapper(event):
+        if db is None:
+            await event.respond("⏳ Starting up, try again in a moment.")
+            return
+        return await handler(event)
+    return wrapper
+
+def register_handlers():
+    """Attaches the event handlers to the clients (called by create_app())."""
+    bot_client.add_event_handler(needs_state(start_handler), events.NewMessage(pattern='/start'))
+    bot_client.add_event_handler(needs_state(set_interval), events.NewMessage(pattern='/set'))
+    bot_client.add_event_handler(needs_state(stop_handler), events.NewMessage(pattern='/stop'))
+    bot_client.add_event_handler(on_participant_update, events.Raw(types=admins.PARTICIPANT_UPDATES))
+    bot_client.add_event_handler(on_join, events.ChatAction(func=bot_chat_action))
+    bot_client.add_event_handler(fetch_handler, events.NewMessage(pattern='/fetch'))
+    bot_client.add_event_handler(needs_state(broadcast_handler), events.NewMessage(pattern='/broadcast'))
+    bot_client.add_event_handler(needs_state(broadcast_status_handler), events.NewMessage(pattern='/bstatus'))
+    bot_client.add_event_handler(needs_state(broadcast_cancel_handler), events.NewMessage(pattern='/bcancel'))
+    user_client.add_event_handler(on_source_post, events.NewMessage(chats=SOURCE_CHANNEL))
+
+async def startup():
+    """
+    Connects both clients and loads the database concurrently, then starts the
+    forwarding tasks. Joining the source channel, bot commands and the job
+    pipeline are not needed to forward alerts, so they finish in the background.
+    """
+    async def connect_user():
+        await user_client.connect()
+        if not await user_client.is_user_authorized(): raise Exception("Invalid USER_SESSION")
+        mark_startup("user_connected")
+
+    async def connect_bot():
+        await bot_client.start(bot_token=BOT_TOKEN)
+        mark_startup("bot_connected")
+
+    async def load():
+        await asyncio.to_thread(load_state)
+        mark_startup("db_loaded")
+
+    await asyncio.gather(connect_user(), connect_bot(), load())
+    asyncio.create_task(gap_filler())
+    asyncio.create_task(global_scheduler())
+    asyncio.create_task(resume_broadcasts())
+    asyncio.create_task(background_startup())
+    mark_startup("ready")
+
+async def background_startup():
+    try: await user_client(functions.channels.JoinChannelRequest(SOURCE_CHANNEL))
+    except: pass
+    try: await entity_cache.get_me()
+    except Exception as e: logger.warning(f"get_me failed: {e}")
+    await setup_bot_commands()
+    await start_pipeline()
+
+async def start_pipeline():
+    """Starts the parse pool and the job pipeline. First import of scraper/bs4."""
+    global job_store
+    import scraper
+    import pipeline
+    await asyncio.to_thread(scraper.start_parse_pool)
+    job_store = pipeline.JobStore()
+    await pipeline.run_pipeline(job_store)
+
+def shutdown():
+    if store is not None:
+        flush_ledger()
+        store.close()
+    if "scraper" in sys.modules:
+        sys.modules["scraper"].stop_parse_pool()
+
+def run():
+    if not check_config(): sys.exit(1)
+    logger.info("--- Starting Job Alert Bot ---")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        create_app()
+    except Exception as e:
+        logger.critical(f"❌ Failed to initialize Telegram Clients: {e}")
+        sys.exit(1)
     Thread(target=run_web, daemon=True).start()
-    loop = asyncio.get_event_loop()
     try:
-        loop.run_until_complete(user_client.connect())
-        if not loop.run_until_complete(user_client.is_user_authorized()): raise Exception("Invalid USER_SESSION")
+        loop.run_until_complete(startup())
     except Exception as e:
         print(f"❌ Error: {e}")
-        exit(1)
-    try: loop.run_until_complete(user_client(functions.channels.JoinChannelRequest(SOURCE_CHANNEL)))
-    except: pass
-    loop.run_until_complete(setup_bot_commands())
-    loop.create_task(global_scheduler())
-    loop.run_forever()
+        shutdown()
+        sys.exit(1)
+    # Stop cleanly on deploys so pending database writes are flushed.
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown()
+
+if __name__ == '__main__':
+    run()
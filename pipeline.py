@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+import sources
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+JOBS_FILE = os.environ.get("JOBS_FILE", "jobs.json")
+POLL_INTERVAL = int(os.environ.get("JOBS_POLL_INTERVAL", 600))      # seconds between listing polls
+LISTING_LIMIT = int(os.environ.get("JOBS_LISTING_LIMIT", 30))       # jobs read from each source's listing per poll
+DETAIL_WORKERS = int(os.environ.get("JOBS_DETAIL_WORKERS", 4))      # concurrent detail fetches per source
+MAX_STORED_JOBS = 100                                               # parsed jobs kept for /fetch
+MAX_SEEN_KEYS = 15000                                               # size cap of the seen index
+
+class JobStore:
+    """
+    Persistent state of the ingestion pipeline:
+    - seen: index of job keys already expanded (see sources.job_keys; insertion ordered, capped)
+    - jobs: parsed postings, newest first by posted_at:
+      {'title', 'url', 'source', 'details', 'posted_at', 'found_at'}
+    """
+
+    def __init__(self, path=JOBS_FILE):
+        self.path = path
+        self.seen = {}
+        self.jobs = []
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.seen = dict.fromkeys(sources.normalize_url(key) if key.startswith("http") else key
+                                      for key in data.get("seen", []) if not key.startswith("title:"))
+            self.jobs = data.get("jobs", [])
+        except Exception as e:
+            logger.error(f"Could not load {self.path}, starting with an empty job index: {e}")
+
+    def save(self):
+        """Writes through a temp file so a crash never leaves a half-written index."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"seen": list(self.seen), "jobs": self.jobs}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def is_new(self, job):
+        return not any(key in self.seen for key in sources.job_keys(job))
+
+    def add(self, job, details):
+        """Stores a parsed posting. Returns False if another source already had the same job."""
+        keys = sources.job_keys(job, details)
+        duplicate = any(key in self.seen for key in keys)
+        for key in keys:
+            self.seen[key] = None
+        while len(self.seen) > MAX_SEEN_KEYS:
+            del self.seen[next(iter(self.seen))]
+        if duplicate:
+            return False
+        now = time.time()
+        self.jobs.append({
+            "title": job["title"],
+            "url": job["url"],
+            "source": job.get("source"),
+            "details": details,
+            "posted_at": job.get("posted_at", now),
+            "found_at": now
+        })
+        self.jobs.sort(key=lambda stored: stored.get("posted_at", stored["found_at"]), reverse=True)
+        del self.jobs[MAX_STORED_JOBS:]
+        return True
+
+    def latest(self):
+        return self.jobs[0] if self.jobs else None
+
+async def ingest_once(store):
+    """
+    Crawls every enabled source once (concurrently, merged into one feed by
+    sources.crawl) and expands only postings not in the seen index, each with
+    its own source's detail extractor. Returns the number of new jobs stored.
+    """
+    feed = await sources.crawl(limit=LISTING_LIMIT)
+    new_jobs = [job for job in feed if store.is_new(job)]
+    if not new_jobs:
+        return 0
+
+    # DETAIL_WORKERS per source, so one slow site does not hold up the others.
+    workers = {}
+
+    async def expand(job):
+        async with workers.setdefault(job["source"], asyncio.Semaphore(DETAIL_WORKERS)):
+            return await sources.get(job["source"]).details(job["url"])
+
+    results = await asyncio.gather(*(expand(job) for job in new_jobs))
+
+    # Feed is newest first: add oldest first so a duplicate keeps the earliest posting.
+    # Failed pages stay unseen and are retried on the next poll.
+    added = 0
+    for job, details in reversed(list(zip(new_jobs, results))):
+        if details and store.add(job, details):
+            added += 1
+    if added:
+        await asyncio.to_thread(store.save)
+    logger.info(f"📰 Job pipeline: {added} new of {len(feed)} listed across {len({job['source'] for job in feed})} sources.")
+    return added
+
+async def run_pipeline(store):
+    logger.info("⏳ Job Pipeline Started...")
+    while True:
+        try:
+            await ingest_once(store)
+        except Exception as e:
+            logger.error(f"Job Pipeline Error: {e}")
+        await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,80 @@
+import os
+import time
+import asyncio
+
+# Telegram allows bots roughly 30 messages/sec overall, about 1/sec to one
+# private chat and 20/min to one group.
+GLOBAL_RATE = float(os.environ.get("SEND_RATE", 25))
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+
+class TokenBucket:
+    """
+    Async token bucket: acquire() waits until a token is available.
+    pause() stops every caller for a while, e.g. after a FloodWaitError.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class ChatLimiter:
+    """Spaces out sends to the same chat (groups have a tighter limit than private chats)."""
+
+    def __init__(self, private_interval=PRIVATE_CHAT_INTERVAL, group_interval=GROUP_CHAT_INTERVAL):
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self._next_allowed = {}
+
+    def ready_at(self, chat_id):
+        """Monotonic time from which the chat's next send may start."""
+        return self._next_allowed.get(int(chat_id), 0.0)
+
+    def reserve(self, chat_id):
+        """Claims the chat's next slot and returns the seconds until it starts (0 if now)."""
+        chat_id = int(chat_id)
+        now = time.monotonic()
+        slot = max(now, self._next_allowed.get(chat_id, 0.0))
+        interval = self.group_interval if chat_id < 0 else self.private_interval
+        self._next_allowed[chat_id] = slot + interval
+        if len(self._next_allowed) > 50000:
+            self._prune(now)
+        return slot - now
+
+    def defer(self, chat_id, seconds):
+        """Keeps the chat closed for `seconds`, e.g. after a FloodWaitError for it."""
+        chat_id = int(chat_id)
+        self._next_allowed[chat_id] = max(self.ready_at(chat_id), time.monotonic() + seconds)
+
+    async def wait(self, chat_id):
+        delay = self.reserve(chat_id)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _prune(self, now):
+        self._next_allowed = {cid: t for cid, t in self._next_allowed.items() if t > now}
+
+# Shared by every sender in the process so their combined rate stays in bounds.
+global_bucket = TokenBucket(GLOBAL_RATE)
+chat_limiter = ChatLimiter()
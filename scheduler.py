@@ -0,0 +1,82 @@
+import heapq
+
+class GroupSchedule:
+    """
+    Min-heap of groups keyed by their next due time (last_post + interval).
+
+    The group dicts in db["groups"] stay the source of truth: a popped entry is
+    re-checked against them, so entries made stale by /set, /stop or a new
+    last_post are skipped or re-pushed instead of having to be removed.
+    Groups that came due with nothing new to send are parked in `idle` until
+    the next source post arrives, so no pass has to look at every group.
+    """
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.idle = set()
+        self._heap = []
+        self._due = {}      # gid -> due time of its one valid heap entry
+        for gid in list(groups):
+            self.update(gid)
+
+    @staticmethod
+    def due_time(settings):
+        return settings.get("last_post", 0) + settings.get("interval", 30) * 60
+
+    def _active(self, gid):
+        settings = self.groups.get(gid)
+        return settings if settings is not None and settings.get("active", True) else None
+
+    def update(self, gid):
+        """(Re)schedules a group after its settings or last_post changed."""
+        self.idle.discard(gid)
+        settings = self._active(gid)
+        if settings is None:
+            self._due.pop(gid, None)
+            return
+        due = self.due_time(settings)
+        self._due[gid] = due
+        heapq.heappush(self._heap, (due, gid))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._compact()
+
+    def _compact(self):
+        self._heap = [(due, gid) for gid, due in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def pop_due(self, now):
+        """Removes and returns every group due at `now`."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, gid = heapq.heappop(self._heap)
+            if self._due.get(gid) != when:
+                continue
+            settings = self._active(gid)
+            if settings is None:
+                del self._due[gid]
+                continue
+            actual = self.due_time(settings)
+            if actual > now:
+                self._due[gid] = actual
+                heapq.heappush(self._heap, (actual, gid))
+                continue
+            del self._due[gid]
+            due.append(gid)
+        return due
+
+    def park(self, gid):
+        """A due group had nothing to send: wake it with the next post instead of every pass."""
+        self.idle.add(gid)
+
+    def take_idle(self):
+        idle, self.idle = self.idle, set()
+        return [gid for gid in idle if self._active(gid) is not None]
+
+    def next_due(self):
+        """Earliest due time still scheduled, or None."""
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._due) + len(self.idle)
@@ -1,7 +1,23 @@
+import os
+import asyncio
+import threading
+import time
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
 from bs4 import BeautifulSoup
 import logging
 import re
+from bisect import bisect_right
+from html.parser import HTMLParser
+
+import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -11,159 +27,648 @@ HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 }
 
-def get_latest_jobs():
+LISTING_URL = "https://sarkariresult.com.cm/latest-jobs/"
+LISTING_LIMIT = int(os.environ.get("SCRAPER_LISTING_LIMIT", 10))
+STREAM_LISTING = os.environ.get("SCRAPER_STREAM_LISTING", "1") == "1"
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# --- HTTP ENGINE CONFIG ---
+REQUEST_TIMEOUT = float(os.environ.get("SCRAPER_TIMEOUT", 10))
+MAX_RETRIES = int(os.environ.get("SCRAPER_RETRIES", 2))
+RETRY_BACKOFF = float(os.environ.get("SCRAPER_RETRY_BACKOFF", 0.5))
+PER_HOST_LIMIT = int(os.environ.get("SCRAPER_PER_HOST_LIMIT", 4))
+HOST_DELAY = float(os.environ.get("SCRAPER_HOST_DELAY", 0.25))      # min seconds between requests to one host
+POOL_HOSTS = int(os.environ.get("SCRAPER_POOL_HOSTS", 32))          # hosts whose keep-alive pools are kept
+FETCH_THREADS = int(os.environ.get("SCRAPER_FETCH_THREADS", 64))    # blocking fetches running at once, all hosts
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+_host_slots = {}        # host -> earliest monotonic time its next request may start
+_host_slots_lock = threading.Lock()
+_fetch_executor = None
+_fetch_executor_lock = threading.Lock()
+
+def get_session():
     """
-    Fetches the list of latest jobs from the main listing page.
-    Returns a list of dictionaries: {'title': str, 'url': str}
+    Returns the shared keep-alive session used by every scraper request.
+    Connections are pooled per host (at most PER_HOST_LIMIT open at once) and
+    transient failures (connect errors, 429, 5xx) are retried with backoff.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=MAX_RETRIES,
+                    backoff_factor=RETRY_BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=PER_HOST_LIMIT, pool_block=True, max_retries=retry)
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def _host_limit(url):
+    """Per-host semaphore so async callers never queue more work than the pool can serve."""
+    host = urlsplit(url).netloc
+    sem = _host_limits.get(host)
+    if sem is None:
+        sem = _host_limits[host] = asyncio.Semaphore(PER_HOST_LIMIT)
+    return sem
+
+def _wait_turn(url):
     """
-    url = "https://sarkariresult.com.cm/latest-jobs/"
+    Politeness delay: requests to one host start at least HOST_DELAY apart,
+    however many callers (or sources on that host) are fetching concurrently.
+    """
+    if HOST_DELAY <= 0:
+        return
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        now = time.monotonic()
+        slot = max(now, _host_slots.get(host, 0.0))
+        _host_slots[host] = slot + HOST_DELAY
+    if slot > now:
+        time.sleep(slot - now)
+
+def _get_executor():
+    # Own thread pool, so crawling many hosts at once is not capped by (or
+    # starving) the event loop's default executor.
+    global _fetch_executor
+    if _fetch_executor is None:
+        with _fetch_executor_lock:
+            if _fetch_executor is None:
+                _fetch_executor = ThreadPoolExecutor(FETCH_THREADS, thread_name_prefix="scraper")
+    return _fetch_executor
+
+async def _run_in_pool(url, func, *args):
+    async with _host_limit(url):
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), functools.partial(func, *args))
+
+# --- PARSER BACKEND ---
+def _resolve_parser(name):
+    """html.parser is always available; lxml is faster but optional."""
+    if name == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            logger.warning("SCRAPER_PARSER=lxml but lxml is not installed, using html.parser")
+            return "html.parser"
+    return name
+
+PARSER = _resolve_parser(os.environ.get("SCRAPER_PARSER", "html.parser"))
+
+# --- PARSE POOL ---
+# Tree building holds the GIL for a long time on big pages. With the pool
+# started, fetched HTML is parsed in worker processes and only the plain
+# result dicts come back, so parsing runs on other cores.
+PARSE_WORKERS = int(os.environ.get("SCRAPER_PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def _warm_worker():
+    """Worker initializer: pays for the parser's first-use setup once per process."""
+    BeautifulSoup("<html><body><table><tr><td>warm</td></tr></table></body></html>", PARSER)
+
+def start_parse_pool(workers=PARSE_WORKERS):
+    """
+    Starts the parse workers and waits until they are up. Workers come from a
+    fork server where the platform has one (spawn elsewhere), so this is safe
+    to call after other threads have started; the server re-imports the main
+    module, which therefore must not do any work at import time.
+    With workers=0 no pool is started and parsing stays on the calling thread.
+    """
+    global _parse_pool
+    if workers <= 0:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method), initializer=_warm_worker)
+            for future in [pool.submit(os.getpid) for _ in range(workers)]:
+                future.result()
+            _parse_pool = pool
+            logger.info(f"Parse pool started with {workers} workers")
+    return _parse_pool
+
+def stop_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def parse_in_pool(parse, html):
+    """
+    Runs parse(html) on a parse worker and returns its result. `parse` must be
+    picklable (a module-level function or a functools.partial of one). Falls
+    back to parsing inline when the pool is not running or has died.
+    """
+    pool = _parse_pool
+    if pool is None:
+        return parse(html)
     try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        jobs = []
-        # Sarkari sites usually list jobs in a specific container or just unordered lists
-        # We look for all links that contain typical job keywords or are in the main content area
-        for link in soup.find_all('a'):
-            text = link.get_text(strip=True)
-            href = link.get('href')
-            
-            # Simple filter to ensure we get relevant job links
-            # Added case-insensitive check and 'Form' keyword for robustness
-            if href and ("online form" in text.lower() or "apply" in text.lower()) and href.startswith("http"):
-                jobs.append({
-                    "title": text,
-                    "url": href
-                })
+        return pool.submit(parse, html).result()
+    except BrokenProcessPool:
+        logger.error("Parse pool died, parsing inline from now on")
+        stop_parse_pool()
+        return parse(html)
+
+# --- RESPONSE CACHE ---
+CACHE_TTL = float(os.environ.get("SCRAPER_CACHE_TTL", 60))
+CACHE_SIZE = int(os.environ.get("SCRAPER_CACHE_SIZE", 256))
+
+class PageCache:
+    """
+    Bounded LRU of parsed results keyed by URL.
+    Entries younger than `ttl` are served without touching the network. Older
+    entries are kept (until evicted by size) so their ETag/Last-Modified can be
+    used to revalidate: a 304 reuses the stored result without re-parsing.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Striped locks: concurrent fetches of one URL wait for the first one
+        # instead of all going to the network. A holder may sit out a
+        # politeness delay, so stripes are plentiful to keep hosts apart.
+        self._fetch_locks = [threading.Lock() for _ in range(256)]
+
+    def fetch_lock(self, url):
+        return self._fetch_locks[hash(url) % len(self._fetch_locks)]
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def is_fresh(self, entry):
+        return time.monotonic() - entry["stored_at"] < self.ttl
+
+    def put(self, url, value, etag=None, last_modified=None):
+        with self._lock:
+            self._entries[url] = {
+                "value": value,
+                "etag": etag,
+                "last_modified": last_modified,
+                "stored_at": time.monotonic()
+            }
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def touch(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                entry["stored_at"] = time.monotonic()
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.revalidated = 0
+
+    def stats(self):
+        lookups = self.hits + self.revalidated + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.revalidated) / lookups if lookups else 0.0
+        }
+
+_cache = PageCache()
+
+def cache_stats():
+    """Hit/miss counters for the page cache. Revalidated (304) lookups count as hits."""
+    return _cache.stats()
+
+# --- METRICS ---
+SCRAPE_SECONDS = metrics.histogram("scraper_call_seconds", "Scraper call latency, cache hits included", ["op"])
+SCRAPE_ERRORS = metrics.counter("scraper_errors_total", "Scraper calls that failed", ["op"])
+metrics.counter("scraper_cache_hits_total", "Page cache hits", func=lambda: _cache.hits)
+metrics.counter("scraper_cache_revalidated_total", "Page cache entries revalidated with a 304", func=lambda: _cache.revalidated)
+metrics.counter("scraper_cache_misses_total", "Page cache misses", func=lambda: _cache.misses)
+
+def _fetch_parsed(url, parse, key=None, stream=False):
+    """
+    Returns the parsed result for `url`, going through the page cache under
+    `key` (defaults to the URL). parse() gets the page text (parsed on the
+    parse pool when it runs), or the open response when `stream` is set so
+    it can stop reading early.
+    Only one request per key is in flight at a time; a burst of callers shares its result.
+    """
+    key = key or url
+    with _cache.fetch_lock(key):
+        entry = _cache.get(key)
+        if entry is not None and _cache.is_fresh(entry):
+            _cache.record("hits")
+            return entry["value"]
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]: headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]: headers["If-Modified-Since"] = entry["last_modified"]
+
+        _wait_turn(url)
+        response = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=stream)
+        try:
+            if response.status_code == 304 and entry is not None:
+                _cache.record("revalidated")
+                _cache.touch(key)
+                return entry["value"]
+            response.raise_for_status()
+
+            _cache.record("misses")
+            value = parse(response) if stream else parse_in_pool(parse, response.text)
+        finally:
+            response.close()
+        _cache.put(key, value, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return value
+
+# --- PARSERS ---
+
+def _is_job_link(text, href):
+    # Simple filter to ensure we get relevant job links
+    # Added case-insensitive check and 'Form' keyword for robustness
+    lowered = text.lower()
+    return bool(href) and ("online form" in lowered or "apply" in lowered) and href.startswith("http")
+
+def parse_latest_jobs(html, parser=None, limit=LISTING_LIMIT):
+    """Extracts job links from the listing page HTML. Returns [{'title', 'url'}, ...]."""
+    soup = BeautifulSoup(html, parser or PARSER)
+
+    jobs = []
+    # Sarkari sites usually list jobs in a specific container or just unordered lists
+    # We look for all links that contain typical job keywords or are in the main content area
+    for link in soup.find_all('a'):
+        text = link.get_text(strip=True)
+        href = link.get('href')
         
-        return jobs[:10] # Return top 10 latest jobs
+        if _is_job_link(text, href):
+            jobs.append({
+                "title": text,
+                "url": href
+            })
+            if len(jobs) >= limit:
+                break
+
+    return jobs
+
+_VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer'
+])
+_SKIP_TEXT_TAGS = ('script', 'style', 'template')
+
+class _ListingStream(HTMLParser):
+    """
+    Incremental tokenizer for the listing page. Collects job links from fed
+    chunks and sets `done` once `limit` of them are found, so the caller can
+    stop reading. Link text follows get_text(strip=True): every text piece
+    inside the <a> is stripped and the pieces are joined.
+    """
+
+    def __init__(self, limit):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.jobs = []
+        self.done = False
+        self._seq = 0
+        self._tags = []       # names of open elements
+        self._open = []       # open <a> tags: [seq, href, [text pieces]]
+        self._closed = []     # finished <a> tags still nested in an open one
+        self._skip = 0        # depth inside script/style/template, whose text get_text ignores
+        self._text = []       # raw text since the last markup; chunks may split it
+
+    def _end_text(self):
+        # A text node only ends at markup, so strip it as a whole.
+        if self._text:
+            data = "".join(self._text).strip()
+            self._text = []
+            if data:
+                for anchor in self._open:
+                    anchor[2].append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text()
+        if tag in _VOID_TAGS:
+            return
+        self._tags.append(tag)
+        if tag == 'a':
+            self._open.append([self._seq, dict(attrs).get('href'), []])
+            self._seq += 1
+        elif tag in _SKIP_TEXT_TAGS:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        self._end_text()
+        if tag not in self._tags:
+            return
+        # An end tag closes everything opened after its start tag (e.g. </p>
+        # also ends an unclosed <a> inside it), as BeautifulSoup does.
+        while True:
+            name = self._tags.pop()
+            if name == 'a':
+                self._closed.append(self._open.pop())
+            elif name in _SKIP_TEXT_TAGS:
+                self._skip -= 1
+            if name == tag:
+                break
+        if self._closed and not self._open:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._open and not self._skip:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._end_text()
+
+    def handle_decl(self, decl):
+        self._end_text()
+
+    def handle_pi(self, data):
+        self._end_text()
+
+    def _flush(self):
+        # Emit in start-tag order, like find_all('a'), even for nested anchors.
+        for _, href, pieces in sorted(self._closed, key=lambda anchor: anchor[0]):
+            if self.done: break
+            text = "".join(pieces)
+            if _is_job_link(text, href):
+                self.jobs.append({"title": text, "url": href})
+                self.done = len(self.jobs) >= self.limit
+        self._closed = []
+
+    def close(self):
+        super().close()
+        self._end_text()
+        # Unclosed anchors end with the document, as in BeautifulSoup.
+        self._closed.extend(self._open)
+        self._open = []
+        self._flush()
+
+def stream_latest_jobs(response, limit=LISTING_LIMIT):
+    """
+    Reads the listing response in STREAM_CHUNK_SIZE chunks and stops as soon as
+    `limit` job links are found. Memory stays bounded by the chunk size rather
+    than the page size.
+    """
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    parser = _ListingStream(limit)
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True):
+        parser.feed(chunk)
+        if parser.done:
+            return parser.jobs
+    parser.close()
+    return parser.jobs
+
+_HEADER_TAGS = frozenset(['b', 'strong', 'h2', 'h3', 'p', 'font'])
+_CONTAINER_TAGS = frozenset(['ul', 'table', 'div'])
+_STOP_TAGS = ('b', 'strong', 'h2', 'h3')
+
+class _PageIndex:
+    """
+    Everything parse_job_details needs, collected in one pre-order walk:
+    title candidates, keyword header candidates, the document position of every
+    ul/table/div, and the td cells of every table row (grouped per table).
+    """
+
+    def __init__(self, soup):
+        self.h1 = None
+        self.h2 = None
+        self.headers = []           # [(position, tag)] in document order
+        self.container_pos = []     # sorted positions of ul/table/div
+        self.container_tags = []
+        self.tables = []            # [[row_cells, ...], ...] in document order
+        self._content = {}
+
+        open_tables = []
+        open_rows = []
+        position = 0
+        stack = [(soup, False)]
+        while stack:
+            node, leaving = stack.pop()
+            name = node.name
+            if leaving:
+                if name == 'table': open_tables.pop()
+                elif name == 'tr': open_rows.pop()
+                continue
+
+            position += 1
+            if name == 'h1':
+                if self.h1 is None: self.h1 = node
+            elif name == 'h2':
+                if self.h2 is None: self.h2 = node
+            if name in _HEADER_TAGS:
+                self.headers.append((position, node))
+            if name in _CONTAINER_TAGS:
+                self.container_pos.append(position)
+                self.container_tags.append(node)
+
+            # A nested table's rows also belong to every enclosing table, and a
+            # nested cell to every enclosing row (same as find_all('tr'/'td')).
+            if name == 'table':
+                rows = []
+                self.tables.append(rows)
+                open_tables.append(rows)
+                stack.append((node, True))
+            elif name == 'tr':
+                cells = []
+                for rows in open_tables: rows.append(cells)
+                open_rows.append(cells)
+                stack.append((node, True))
+            elif name == 'td':
+                for cells in open_rows: cells.append(node)
+
+            children = [child for child in node.contents if child.name is not None]
+            for child in reversed(children):
+                stack.append((child, False))
+
+    def following_text(self, position, element):
+        """Content of the first ul/table/div after `element`, else its plain text siblings."""
+        content = []
+        i = bisect_right(self.container_pos, position)
+        if i < len(self.container_pos):
+            content = self._container_content(i)
+
+        if not content:
+            for sibling in element.next_siblings:
+                if sibling.name in _STOP_TAGS: # Stop at next header
+                    break
+                if isinstance(sibling, str):
+                    clean_text = sibling.strip()
+                    if clean_text: content.append(clean_text)
+                elif sibling.name in ['br', 'p', 'span']:
+                    clean_text = sibling.get_text(strip=True)
+                    if clean_text: content.append(clean_text)
+        return content
+
+    def _container_content(self, i):
+        # Several headers often point at the same container; parse it once.
+        if i not in self._content:
+            curr = self.container_tags[i]
+            content = []
+            for li in curr.find_all('li'):
+                clean_li = li.get_text(strip=True)
+                if clean_li: content.append(clean_li)
+            if not content:
+                for tr in curr.find_all('tr'):
+                    clean_tr = tr.get_text(" ", strip=True) # Join cells with space
+                    if clean_tr: content.append(clean_tr)
+            self._content[i] = content
+        return list(self._content[i])
+
+def parse_job_details(html, parser=None):
+    """
+    Extracts title, dates, fees, age limit and links from a job page's HTML.
+    The tree is walked once (see _PageIndex); keyword headers are then matched
+    in document order and stop being inspected once every field is filled.
+    """
+    soup = BeautifulSoup(html, parser or PARSER)
+    page = _PageIndex(soup)
+
+    details = {
+        "title": "",
+        "dates": [],
+        "fees": [],
+        "age_limit": [],
+        "links": {}
+    }
+
+    # 1. Get Title (fallback to the first h2 if there is no h1)
+    if page.h1 is not None:
+        details['title'] = page.h1.get_text(strip=True)
+    elif page.h2 is not None:
+        details['title'] = page.h2.get_text(strip=True)
+
+    # 2. Extract Data by Keywords (Dates, Fee, Age)
+    for position, el in page.headers:
+        if details['dates'] and details['fees'] and details['age_limit']:
+            break
+        text = el.get_text(strip=True).lower()
+
+        # Robust matching for keywords
+        if "important dates" in text or "dates" in text and "start" in text:
+            # Avoid overwriting if we already found better data
+            if not details['dates']:
+                details['dates'] = page.following_text(position, el)
+        elif "application fee" in text or "fee details" in text:
+            if not details['fees']:
+                details['fees'] = page.following_text(position, el)
+        elif "age limit" in text or "age criteria" in text:
+            if not details['age_limit']:
+                details['age_limit'] = page.following_text(position, el)
+
+    # 3. Extract Important Links (Apply Online, Notification)
+    # Usually found in a table at the bottom.
+    # All links in the last cell are used (e.g. Registration | Login)
+    for rows in page.tables:
+        for cols in rows:
+            if len(cols) >= 2:
+                label = cols[0].get_text(strip=True).lower()
+
+                # Check last column for links
+                for link_tag in cols[-1].find_all('a'):
+                    url = link_tag.get('href')
+                    link_text = link_tag.get_text(strip=True)
+
+                    if url and "http" in url:
+                        if "apply online" in label or "registration" in label:
+                            # Use specific text if available (e.g., "Login" vs "Registration")
+                            key = "Apply Online"
+                            if "login" in link_text.lower():
+                                key = "Apply - Login"
+                            elif "registration" in link_text.lower():
+                                key = "Apply - Registration"
+                            details['links'][key] = url
+
+                        elif "notification" in label:
+                            details['links']['Notification'] = url
+                        elif "official website" in label:
+                            details['links']['Official Website'] = url
+
+    return details
+
+# --- SYNC API ---
+
+@SCRAPE_SECONDS.time(op="latest_jobs")
+def get_listing(url, limit=LISTING_LIMIT, parse=parse_latest_jobs, stream_parse=None):
+    """
+    Fetches the first `limit` jobs from any listing page, extracted with
+    parse(html, limit=...). With `stream_parse(response, limit)` the page is
+    tokenized while downloading and the connection is dropped once enough jobs
+    are found. Returns a list of dictionaries: {'title': str, 'url': str}
+    """
+    stream = stream_parse is not None
+    key = f"{url}#limit={limit}&stream={int(stream)}"
+    try:
+        if stream:
+            return _fetch_parsed(url, lambda r: stream_parse(r, limit), key=key, stream=True)
+        return _fetch_parsed(url, functools.partial(parse, limit=limit), key=key)
     except Exception as e:
-        logger.error(f"Error fetching latest jobs: {e}")
+        SCRAPE_ERRORS.inc(op="latest_jobs")
+        logger.error(f"Error fetching latest jobs from {url}: {e}")
         return []
 
-def get_job_details(job_url):
+def get_latest_jobs(limit=LISTING_LIMIT, stream=STREAM_LISTING):
+    """
+    Fetches the first `limit` jobs from the main listing page.
+    Returns a list of dictionaries: {'title': str, 'url': str}
+    With `stream` the page is tokenized while downloading and the connection
+    is dropped once enough jobs are found.
+    """
+    return get_listing(LISTING_URL, limit, stream_parse=stream_latest_jobs if stream else None)
+
+@SCRAPE_SECONDS.time(op="job_details")
+def get_job_details(job_url, parse=parse_job_details):
     """
     Fetches detailed information from a specific job URL.
     Extracts: Important Dates, Application Fee, Age Limit, vacancy, and Apply Links.
+    Other sites pass their own `parse` (see sources.py).
     """
     try:
-        response = requests.get(job_url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        details = {
-            "title": "",
-            "dates": [],
-            "fees": [],
-            "age_limit": [],
-            "links": {}
-        }
-        
-        # 1. Get Title
-        h1 = soup.find('h1')
-        if h1:
-            details['title'] = h1.get_text(strip=True)
-        else:
-            # Fallback if no h1, try finding the first major header
-            h2 = soup.find('h2')
-            if h2: details['title'] = h2.get_text(strip=True)
-
-        # 2. Extract Data by Keywords (Dates, Fee, Age)
-        # We iterate through all text elements to find headers, then grab the content following them
-        # Added 'p' and 'font' tags which sometimes contain headers in older HTML layouts
-        text_elements = soup.find_all(['b', 'strong', 'h2', 'h3', 'p', 'font'])
-        
-        for el in text_elements:
-            text = el.get_text(strip=True).lower()
-            
-            # Helper to get the next list, table, or text content
-            def get_following_text(element):
-                content = []
-                # Strategy 1: Look for immediate sibling container (ul, table, div)
-                curr = element.find_next(['ul', 'table', 'div'])
-                
-                # Check if the container is "close enough" (not halfway down the page)
-                # If we found a container, parse it
-                if curr:
-                    # Check lists
-                    for li in curr.find_all('li'):
-                        clean_li = li.get_text(strip=True)
-                        if clean_li: content.append(clean_li)
-                    
-                    # Check table rows if list was empty
-                    if not content:
-                        for tr in curr.find_all('tr'):
-                            clean_tr = tr.get_text(" ", strip=True) # Join cells with space
-                            if clean_tr: content.append(clean_tr)
-                            
-                # Strategy 2: If no structured container, capture plain text siblings
-                # This handles cases where data is just lines of text separated by <br>
-                if not content:
-                    for sibling in element.next_siblings:
-                        if sibling.name in ['b', 'strong', 'h2', 'h3']: # Stop at next header
-                            break
-                        if isinstance(sibling, str):
-                            clean_text = sibling.strip()
-                            if clean_text: content.append(clean_text)
-                        elif sibling.name in ['br', 'p', 'span']:
-                            clean_text = sibling.get_text(strip=True)
-                            if clean_text: content.append(clean_text)
-                            
-                return content
-
-            # Robust matching for keywords
-            if "important dates" in text or "dates" in text and "start" in text:
-                # Avoid overwriting if we already found better data
-                if not details['dates']: 
-                    details['dates'] = get_following_text(el)
-            elif "application fee" in text or "fee details" in text:
-                if not details['fees']:
-                    details['fees'] = get_following_text(el)
-            elif "age limit" in text or "age criteria" in text:
-                if not details['age_limit']:
-                    details['age_limit'] = get_following_text(el)
-
-        # 3. Extract Important Links (Apply Online, Notification)
-        # Usually found in a table at the bottom.
-        # Added logic to find ALL links in the row (e.g. Registration | Login)
-        tables = soup.find_all('table')
-        for table in tables:
-            rows = table.find_all('tr')
-            for row in rows:
-                cols = row.find_all('td')
-                if len(cols) >= 2:
-                    label = cols[0].get_text(strip=True).lower()
-                    
-                    # Check last column for links
-                    link_col = cols[-1]
-                    found_links = link_col.find_all('a')
-                    
-                    for link_tag in found_links:
-                        url = link_tag.get('href')
-                        link_text = link_tag.get_text(strip=True)
-                        
-                        if url and "http" in url:
-                            if "apply online" in label or "registration" in label:
-                                # Use specific text if available (e.g., "Login" vs "Registration")
-                                key = "Apply Online"
-                                if "login" in link_text.lower():
-                                    key = "Apply - Login"
-                                elif "registration" in link_text.lower():
-                                    key = "Apply - Registration"
-                                details['links'][key] = url
-                                
-                            elif "notification" in label:
-                                details['links']['Notification'] = url
-                            elif "official website" in label:
-                                details['links']['Official Website'] = url
-
-        return details
-
+        return _fetch_parsed(job_url, parse)
     except Exception as e:
+        SCRAPE_ERRORS.inc(op="job_details")
         logger.error(f"Error fetching job details: {e}")
         return None
 
+# --- ASYNC API ---
+# The sync functions above block for up to REQUEST_TIMEOUT per attempt, so the
+# bot must never call them from the event loop directly. These wrappers run
+# them on worker threads, bounded per host.
+
+async def get_listing_async(url, limit=LISTING_LIMIT, parse=parse_latest_jobs, stream_parse=None):
+    """Async version of get_listing(), safe to await from Telethon handlers."""
+    return await _run_in_pool(url, get_listing, url, limit, parse, stream_parse)
+
+async def get_job_details_async(job_url, parse=parse_job_details):
+    """Async version of get_job_details(), safe to await from Telethon handlers."""
+    return await _run_in_pool(job_url, get_job_details, job_url, parse)
+
 # --- TEST BLOCK ---
 if __name__ == "__main__":
     print("Fetching Latest Jobs...")
@@ -191,3 +696,5 @@ if __name__ == "__main__":
                 print(f"{k}: {v}")
     else:
         print("No jobs found. Check the URL or selector.")
+
+    print(f"\nCache: {cache_stats()}")
@@ -0,0 +1,149 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit, urlunsplit
+
+import scraper
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# JOB_SOURCES: comma-separated source names to crawl (default: every registered one).
+# JOB_SOURCES_EXTRA: "name=https://site/latest-jobs/,..." adds sites built on the
+# same template as sarkariresult, using its extractors.
+ENABLED = [name.strip() for name in os.environ.get("JOB_SOURCES", "").split(",") if name.strip()]
+EXTRA = os.environ.get("JOB_SOURCES_EXTRA", "")
+RANK_STEP = 0.001       # seconds between consecutive undated postings of one listing
+
+class Source:
+    """
+    One job site: where its listing lives and how to extract it. Extractors
+    run on the parse pool, so they must be module-level functions (or
+    functools.partial of one):
+    - parse_listing(html, limit=...) -> [{'title', 'url'[, 'posted_at']}, ...]
+    - parse_details(html) -> {'title', 'dates', 'fees', 'age_limit', 'links'}
+    - stream_listing(response, limit), optional, reads the listing incrementally
+    A listing may set 'posted_at' (epoch seconds) when the site shows dates.
+    """
+
+    def __init__(self, name, listing_url, parse_listing=scraper.parse_latest_jobs,
+                 parse_details=scraper.parse_job_details, stream_listing=None):
+        self.name = name
+        self.listing_url = listing_url
+        self.parse_listing = parse_listing
+        self.parse_details = parse_details
+        self.stream_listing = stream_listing
+
+    async def listing(self, limit):
+        with CRAWL_SECONDS.time(source=self.name):
+            return await scraper.get_listing_async(self.listing_url, limit, self.parse_listing, self.stream_listing)
+
+    async def details(self, url):
+        return await scraper.get_job_details_async(url, self.parse_details)
+
+    def __repr__(self):
+        return f"Source({self.name!r}, {self.listing_url!r})"
+
+# --- REGISTRY ---
+REGISTRY = {}
+
+def register(source):
+    if source.name in REGISTRY:
+        raise ValueError(f"Source {source.name} already registered")
+    REGISTRY[source.name] = source
+    return source
+
+def get(name):
+    return REGISTRY[name]
+
+def enabled():
+    """Registered sources selected by JOB_SOURCES, in registration order."""
+    if not ENABLED:
+        return list(REGISTRY.values())
+    unknown = [name for name in ENABLED if name not in REGISTRY]
+    if unknown:
+        logger.warning(f"JOB_SOURCES names unknown sources: {', '.join(unknown)}")
+    return [source for name, source in REGISTRY.items() if name in ENABLED]
+
+register(Source("sarkariresult", scraper.LISTING_URL,
+                stream_listing=scraper.stream_latest_jobs if scraper.STREAM_LISTING else None))
+
+for entry in filter(None, (part.strip() for part in EXTRA.split(","))):
+    name, _, url = entry.partition("=")
+    if not url:
+        logger.warning(f"Ignoring JOB_SOURCES_EXTRA entry {entry!r} (expected name=url)")
+        continue
+    register(Source(name.strip(), url.strip()))
+
+# --- METRICS ---
+CRAWL_SECONDS = metrics.histogram("source_listing_seconds", "Listing fetch time per source", ["source"])
+LISTED = metrics.counter("source_jobs_listed_total", "Postings read from each source's listing", ["source"])
+
+# --- DE-DUPLICATION ---
+# Portals repost the same notification under their own URLs, so a posting's
+# identity is a set of keys; sharing any one makes two postings the same job.
+# Titles are only compared within one crawl: recurring recruitments reuse
+# them ("SBI PO Online Form" every year), so they must not be remembered.
+_FILLER_WORDS = frozenset(["online", "form", "apply", "recruitment", "notification", "out", "for", "the", "post", "posts", "vacancy"])
+
+def normalize_url(url):
+    """Lowercase scheme/host without www., no fragment or trailing slash."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip("/"), parts.query, ""))
+
+def normalize_title(title):
+    words = re.findall(r"[a-z0-9]+", title.lower())
+    return " ".join(word for word in words if word not in _FILLER_WORDS)
+
+def job_keys(job, details=None):
+    """
+    Lasting identity keys of a posting (safe to persist): its URL and, once
+    parsed, its notification link. Apply links are left out: one login page
+    often serves every recruitment of an organisation.
+    """
+    keys = [normalize_url(job["url"])]
+    notification = (details or {}).get("links", {}).get("Notification")
+    if notification:
+        keys.append("notification:" + normalize_url(notification))
+    return keys
+
+def merge(feed):
+    """Newest first, keeping the first posting of every job (by job_keys and title)."""
+    seen = set()
+    merged = []
+    for job in sorted(feed, key=lambda job: job["posted_at"], reverse=True):
+        keys = job_keys(job)
+        title = normalize_title(job.get("title", ""))
+        if title:
+            keys.append("title:" + title)
+        if seen.isdisjoint(keys):
+            merged.append(job)
+        seen.update(keys)
+    return merged
+
+# --- CRAWL ---
+async def crawl(limit=scraper.LISTING_LIMIT, sources=None):
+    """
+    Fetches every enabled source's listing concurrently (each host stays under
+    scraper's per-host limits) and merges them into one de-duplicated feed,
+    newest first. Postings are tagged with 'source' and 'posted_at'; undated
+    ones take the crawl time, offset by their rank so each site's order holds.
+    """
+    sources = enabled() if sources is None else list(sources)
+    listings = await asyncio.gather(*(source.listing(limit) for source in sources), return_exceptions=True)
+    crawled_at = time.time()
+    feed = []
+    for source, listing in zip(sources, listings):
+        if isinstance(listing, Exception):
+            logger.error(f"Source {source.name} failed: {listing}")
+            continue
+        LISTED.inc(len(listing), source=source.name)
+        for rank, job in enumerate(listing):
+            feed.append(dict(job, source=source.name, posted_at=job.get("posted_at") or crawled_at - rank * RANK_STEP))
+    return merge(feed)